@@ -3,17 +3,23 @@ import hashlib
 import logging
 from wechatpy.enterprise.crypto import WeChatCrypto
 from wechatpy.enterprise import parse_message, create_reply
+from app.adapters.wecom.fastpath import FastCrypto, FastMessage, FastTextReply, parse_fields
 
 log = logging.getLogger(__name__)
 
 class WeChatCryptoAdapter:
-    """企业微信加解密适配器"""
+    """企业微信加解密适配器
+
+    fast=True（默认）走快速路径（见 fastpath.py，输出与 wechatpy 逐字节一致），
+    fast=False 完全使用 wechatpy。
+    """
     
-    def __init__(self, token: str, aes_key: str, corp_id: str):
+    def __init__(self, token: str, aes_key: str, corp_id: str, fast: bool = True):
         self.token = token
         self.aes_key = aes_key
         self.corp_id = corp_id
-        self.crypto = WeChatCrypto(token, aes_key, corp_id)
+        self.fast = fast
+        self.crypto = FastCrypto(token, aes_key, corp_id) if fast else WeChatCrypto(token, aes_key, corp_id)
     
     def _sha1(self, s: str) -> str:
         """SHA1哈希计算"""
@@ -33,7 +39,7 @@ class WeChatCryptoAdapter:
         """解密消息"""
         try:
             msg_xml = self.crypto.decrypt_message(encrypted_data, msg_signature, timestamp, nonce)
-            msg = parse_message(msg_xml)
+            msg = FastMessage(parse_fields(msg_xml)) if self.fast else parse_message(msg_xml)
             log.info(f"Message decrypted successfully, type={msg.type}")
             return msg
         except Exception as e:
@@ -52,6 +58,8 @@ class WeChatCryptoAdapter:
     
     def create_text_reply(self, content: str, original_msg) -> object:
         """创建文本回复"""
+        if self.fast:
+            return FastTextReply(content, original_msg)
         return create_reply(content, original_msg)
     
     def calculate_local_signature(self, timestamp: str, nonce: str, echostr: str) -> str:
@@ -0,0 +1,193 @@
+# app/adapters/wecom/fastpath.py
+"""
+回调加解密快速路径
+
+与 wechatpy 的 decrypt_message -> parse_message -> create_reply().render() -> encrypt_message
+逐字节一致，区别在于：
+- AES 密码对象按密钥构建一次并复用，不再每次调用重建
+- 信封与消息 XML 用 XMLPullParser 流式解析顶层字段，不构建 xmltodict 字典树
+- 回复与信封 XML 由预编译模板直接格式化
+"""
+import base64
+import hashlib
+import os
+import struct
+import time
+from typing import Dict, Optional, Union
+from xml.etree.ElementTree import XMLPullParser
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:  # 没有 cryptography 时沿用 wechatpy 选择的后端（如 pycryptodome）
+    Cipher = None
+
+# 与 wechatpy.crypto.BaseWeChatCrypto._encrypt_message 相同的信封
+ENVELOPE_TEMPLATE = (
+    "<xml>\n"
+    "<Encrypt><![CDATA[{encrypt}]]></Encrypt>\n"
+    "<MsgSignature><![CDATA[{signature}]]></MsgSignature>\n"
+    "<TimeStamp>{timestamp}</TimeStamp>\n"
+    "<Nonce><![CDATA[{nonce}]]></Nonce>\n"
+    "</xml>"
+)
+
+# 与 wechatpy.enterprise.replies.TextReply.render 相同的字段顺序
+# 注意：与 wechatpy 一样不转义 CDATA 中的 "]]>"
+TEXT_REPLY_TEMPLATE = (
+    "<xml>\n"
+    "<MsgType><![CDATA[text]]></MsgType>\n"
+    "<AgentID>{agent}</AgentID>\n"
+    "<Content><![CDATA[{content}]]></Content>\n"
+    "<FromUserName><![CDATA[{source}]]></FromUserName>\n"
+    "<ToUserName><![CDATA[{target}]]></ToUserName>\n"
+    "<CreateTime>{time}</CreateTime>\n"
+    "</xml>"
+)
+
+_BLOCK_SIZE = 32  # 企业微信使用的 PKCS#7 块大小
+
+class AesCbc:
+    """AES-256-CBC（IV 为密钥前16字节），密码对象只构建一次"""
+
+    def __init__(self, key: bytes):
+        if Cipher is not None:
+            self._cipher = Cipher(algorithms.AES(key), modes.CBC(key[:16]))
+            self._fallback = None
+        else:
+            from wechatpy.crypto.base import WeChatCipher
+            self._cipher = None
+            self._fallback = WeChatCipher(key)
+
+    def encrypt(self, data: bytes) -> bytes:
+        if self._fallback is not None:
+            return self._fallback.encrypt(data)
+        encryptor = self._cipher.encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+
+    def decrypt(self, data: bytes) -> bytes:
+        if self._fallback is not None:
+            return self._fallback.decrypt(data)
+        decryptor = self._cipher.decryptor()
+        return decryptor.update(data) + decryptor.finalize()
+
+def parse_fields(xml: Union[str, bytes], stop: Optional[str] = None) -> Dict[str, str]:
+    """流式解析 <xml> 下的顶层字段为 {标签: 文本}；读到 stop 字段后立即返回
+
+    与 wechatpy 使用的 xmltodict 一致：文本去除首尾空白，空字段的值为None。
+    """
+    parser = XMLPullParser(events=("end",))
+    parser.feed(xml)
+    root = None
+    for _, elem in parser.read_events():
+        if elem.tag == stop:
+            return {stop: _text(elem)}
+        root = elem
+    parser.close()  # 不完整的XML在此抛出ParseError
+    # 子元素先于父元素结束，最后一个结束的是根元素
+    return {child.tag: _text(child) for child in root} if root is not None else {}
+
+def _text(elem) -> Optional[str]:
+    return (elem.text.strip() if elem.text else None) or None
+
+class FastMessage:
+    """解密后的回调消息（只保留处理所需的字段）"""
+    __slots__ = ("type", "event", "content", "source", "target", "agent", "id", "time", "_data")
+
+    def __init__(self, data: Dict[str, str]):
+        self._data = data
+        self.type = (data.get("MsgType") or "unknown").lower()
+        self.event = (data.get("Event") or "").lower() or None
+        self.content = data.get("Content")
+        self.source = data.get("FromUserName")
+        self.target = data.get("ToUserName")
+        self.agent = int(data.get("AgentID") or 0)
+        self.id = int(data.get("MsgId") or 0)
+        self.time = int(data.get("CreateTime") or 0)
+
+    def __repr__(self) -> str:
+        return f"FastMessage({self._data!r})"
+
+class FastTextReply:
+    """文本回复，render() 输出与 wechatpy TextReply 相同的 XML"""
+    __slots__ = ("content", "source", "target", "agent", "time")
+
+    def __init__(self, content: str, message: FastMessage):
+        self.content = content
+        self.source = message.target
+        self.target = message.source
+        self.agent = message.agent
+        self.time = int(time.time())
+
+    def render(self) -> str:
+        return TEXT_REPLY_TEMPLATE.format(
+            agent=self.agent, content=self.content, source=self.source,
+            target=self.target, time=self.time
+        )
+
+def signature(token: str, timestamp: str, nonce: str, encrypt: str) -> str:
+    """消息签名：排序拼接后取SHA1"""
+    return hashlib.sha1("".join(sorted([token, timestamp, nonce, encrypt])).encode("utf-8")).hexdigest()
+
+class FastCrypto:
+    """企业微信消息加解密（与 wechatpy.enterprise.crypto.WeChatCrypto 兼容）"""
+
+    def __init__(self, token: str, aes_key: str, corp_id: str):
+        key = base64.b64decode(aes_key + "=")
+        assert len(key) == 32
+        self.token = token
+        self.corp_id = corp_id
+        self._corp_id_bytes = corp_id.encode("utf-8")
+        self._aes = AesCbc(key)
+
+    def _random_prefix(self) -> bytes:
+        """16字节随机前缀"""
+        return os.urandom(16)
+
+    def encrypt(self, text: str) -> str:
+        """加密明文：随机前缀 + 网络序长度 + 明文 + corp_id，PKCS#7 填充后 Base64"""
+        body = text.encode("utf-8")
+        raw = b"".join((self._random_prefix(), struct.pack(">I", len(body)), body, self._corp_id_bytes))
+        pad = _BLOCK_SIZE - len(raw) % _BLOCK_SIZE
+        raw += bytes((pad,)) * pad
+        return base64.b64encode(self._aes.encrypt(raw)).decode("ascii")
+
+    def decrypt(self, encrypt: str) -> str:
+        """解密密文并校验 corp_id"""
+        from wechatpy.enterprise.exceptions import InvalidCorpIdException
+
+        plain = self._aes.decrypt(base64.b64decode(encrypt))
+        pad = plain[-1]
+        content = plain[16:-pad]
+        (length,) = struct.unpack(">I", content[:4])
+        if content[4 + length:] != self._corp_id_bytes:
+            raise InvalidCorpIdException()
+        return content[4:4 + length].decode("utf-8")
+
+    def _check(self, msg_signature: str, timestamp: str, nonce: str, encrypt: str):
+        if signature(self.token, timestamp, nonce, encrypt) != msg_signature:
+            from wechatpy.exceptions import InvalidSignatureException
+            raise InvalidSignatureException()
+
+    def check_signature(self, msg_signature: str, timestamp: str, nonce: str, echostr: str) -> str:
+        """URL验证：校验签名并解密echostr"""
+        self._check(msg_signature, timestamp, nonce, echostr)
+        return self.decrypt(echostr)
+
+    def decrypt_message(self, data: Union[str, bytes], msg_signature: str, timestamp: str, nonce: str) -> str:
+        """解密回调信封，返回消息明文XML"""
+        encrypt = parse_fields(data, stop="Encrypt").get("Encrypt")
+        if encrypt is None:
+            raise ValueError("Encrypt field not found in callback body")
+        self._check(msg_signature, timestamp, nonce, encrypt)
+        return self.decrypt(encrypt)
+
+    def encrypt_message(self, msg: str, nonce: str, timestamp: Optional[str] = None) -> str:
+        """加密回复并生成信封XML"""
+        timestamp = timestamp or str(int(time.time()))
+        encrypt = self.encrypt(msg)
+        return ENVELOPE_TEMPLATE.format(
+            encrypt=encrypt,
+            signature=signature(self.token, timestamp, nonce, encrypt),
+            timestamp=timestamp,
+            nonce=nonce
+        )
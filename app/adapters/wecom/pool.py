@@ -0,0 +1,30 @@
+# app/adapters/wecom/pool.py
+import threading
+import logging
+from typing import Dict, Tuple
+from app.adapters.wecom.crypto import WeChatCryptoAdapter
+
+log = logging.getLogger(__name__)
+
+class CryptoAdapterPool:
+    """加解密适配器池：按 (token, aes_key, corp_id) 预构建并复用适配器"""
+    
+    def __init__(self, fast: bool = True):
+        self.fast = fast  # 是否使用加解密快速路径
+        self._lock = threading.Lock()
+        self._adapters: Dict[Tuple[str, str, str], WeChatCryptoAdapter] = {}
+    
+    def get(self, token: str, aes_key: str, corp_id: str) -> WeChatCryptoAdapter:
+        """获取（必要时创建）适配器"""
+        key = (token, aes_key, corp_id)
+        with self._lock:
+            adapter = self._adapters.get(key)
+            if adapter is None:
+                adapter = self._adapters[key] = WeChatCryptoAdapter(
+                    token=token, aes_key=aes_key, corp_id=corp_id, fast=self.fast
+                )
+                log.info(f"Built crypto adapter for corp_id={corp_id[:4]}..., pool size={len(self._adapters)}")
+            return adapter
+    
+    def __len__(self) -> int:
+        return len(self._adapters)
@@ -0,0 +1,60 @@
+# app/compaction.py
+import logging
+import threading
+from typing import Iterable, List, Tuple
+from core.registry.registry import SourceRegistry
+from core.refresh.engine import RefreshEngine
+
+log = logging.getLogger(__name__)
+
+def compact_all(registry: SourceRegistry, engine: RefreshEngine, retention_seconds: float) -> List[str]:
+    """对注册表中所有启用的数据源执行归档压缩"""
+    return [engine.compact_source(source, retention_seconds)
+            for source in registry.get_enabled_sources().values()]
+
+class CompactionScheduler:
+    """定时归档：后台线程按间隔对各 (注册表, 引擎) 执行压缩"""
+    
+    def __init__(self, targets: Iterable[Tuple[SourceRegistry, RefreshEngine]],
+                 retention_seconds: float, interval_seconds: float):
+        # 多个租户可能共享同一注册表与引擎，只压缩一次
+        seen = set()
+        self.targets = []
+        for registry, engine in targets:
+            key = (id(registry), id(engine))
+            if key not in seen:
+                seen.add(key)
+                self.targets.append((registry, engine))
+        self.retention_seconds = retention_seconds
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def run_once(self):
+        """执行一轮压缩"""
+        for registry, engine in self.targets:
+            for result in compact_all(registry, engine, self.retention_seconds):
+                if result.startswith("[ERR]") or result.startswith("Archived"):
+                    log.info(f"Compaction: {result}")
+    
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                log.error(f"Compaction round failed: {e}")
+    
+    def start(self):
+        """启动后台线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="compaction", daemon=True)
+            self._thread.start()
+            log.info(f"Compaction scheduled every {self.interval_seconds}s "
+                     f"(retention {self.retention_seconds / 86400:g} days)")
+    
+    def stop(self):
+        """停止后台线程"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
@@ -0,0 +1,107 @@
+# app/tenants.py
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from app.adapters.wecom.pool import CryptoAdapterPool
+from app.web.handlers import WebhookHandler
+from app.web.admission import AdmissionControl
+from app.web.profiling import RequestProfiler
+from core.registry.registry import SourceRegistry
+from core.refresh.engine import RefreshEngine
+from core.refresh.filecache import FileCache
+from core.refresh.http_source import HttpConnectionPool
+from config.settings import Settings
+
+log = logging.getLogger(__name__)
+
+class TenantPool:
+    """多租户组件池
+
+    按配置构建各租户的处理器。指向同一注册表文件的租户共享同一个
+    SourceRegistry，指向同一数据目录的租户共享同一个 RefreshEngine，
+    所有引擎共享一个 FileCache（文件锁与已推送状态按绝对路径去重）
+    和一个 HTTP 连接池。
+    """
+    
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.adapters = CryptoAdapterPool(fast=settings.crypto_fast_path)
+        self.file_cache = FileCache()
+        self.http = HttpConnectionPool(
+            max_per_host=settings.http_max_per_host,
+            timeout=settings.http_timeout_seconds
+        )
+        # 限流与并发上限在所有租户间共享：它们保护的是同一进程的磁盘与CPU
+        self.admission = AdmissionControl(
+            rate_per_minute=settings.rate_limit_per_minute,
+            burst=settings.rate_limit_burst,
+            max_concurrency=settings.heavy_max_concurrency,
+            max_queue=settings.heavy_max_queue,
+            queue_timeout=settings.heavy_queue_timeout_seconds
+        )
+        self.profiler = RequestProfiler(
+            Path(settings.profile_dir).expanduser().resolve(),
+            sample_every=settings.profile_sample_every,
+            slow_ms=settings.profile_slow_ms,
+            keep=settings.profile_keep
+        ) if settings.profile_dir else None
+        self._registries: Dict[Path, SourceRegistry] = {}
+        self._engines: Dict[Tuple[Path, Optional[str]], RefreshEngine] = {}
+        self.handlers: Dict[str, WebhookHandler] = {}
+    
+    def registry_for(self, registry_file: str) -> SourceRegistry:
+        """获取注册表（同一文件只加载一次）"""
+        path = Path(registry_file).expanduser().resolve()
+        if path not in self._registries:
+            self._registries[path] = SourceRegistry(path)
+        return self._registries[path]
+    
+    def engine_for(self, base_dir: Path, tenant: Optional[str] = None) -> RefreshEngine:
+        """获取刷新引擎（每个租户一个，同一租户同一目录只创建一次）
+
+        源名称只在租户内唯一：待续源、耗时统计与 .bot_state 下的索引/清单/投递记录按租户隔离，
+        共用数据目录的租户不会互相覆盖；数据文件本身的锁与已推送标记仍由共享的 FileCache 协调。
+        """
+        path = Path(base_dir).expanduser().resolve()
+        key = (path, tenant)
+        if key not in self._engines:
+            self._engines[key] = RefreshEngine(
+                path, cache=self.file_cache, http=self.http,
+                dedup_window=self.settings.dedup_window_seconds,
+                dedup_fields=self.settings.dedup_fields,
+                dedup_max_entries=self.settings.dedup_max_entries,
+                namespace=tenant
+            )
+        return self._engines[key]
+    
+    def build_handler(self, token: str, aes_key: str, corp_id: str,
+                      registry_file: str, base_dir: Path, agent_id: int = 0,
+                      tenant: Optional[str] = None) -> WebhookHandler:
+        """组装一个处理器（tenant 为None时为顶层配置的默认应用）"""
+        return WebhookHandler(
+            self.adapters.get(token, aes_key, corp_id),
+            self.registry_for(registry_file),
+            self.engine_for(base_dir, tenant),
+            refresh_budget=self.settings.refresh_budget_seconds,
+            admission=self.admission,
+            profiler=self.profiler,
+            lease_ttl=self.settings.lease_ttl_seconds,
+            agent_id=agent_id
+        )
+    
+    def load_tenants(self) -> Dict[str, WebhookHandler]:
+        """按配置构建所有租户处理器"""
+        for name, tenant in self.settings.tenants.items():
+            self.handlers[name] = self.build_handler(
+                token=tenant.token,
+                aes_key=tenant.aes_key,
+                corp_id=tenant.corp_id,
+                registry_file=tenant.bot_registry_file,
+                base_dir=tenant.json_base_dir or self.settings.json_base_dir,
+                agent_id=tenant.agent_id,
+                tenant=name
+            )
+        
+        log.info(f"Loaded {len(self.handlers)} tenants: {len(self.adapters)} crypto adapters, "
+                 f"{len(self._registries)} registries, {len(self._engines)} engines")
+        return self.handlers
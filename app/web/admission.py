@@ -0,0 +1,110 @@
+# app/web/admission.py
+import math
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+class RateLimiter:
+    """按用户的令牌桶：每个用户最多积攒 burst 个令牌，每秒补充 rate 个
+
+    只保留最近活跃的 max_users 个用户的桶，超出时淘汰最久未使用的。
+    """
+
+    def __init__(self, rate: float, burst: int, max_users: int = 10000):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # 用户 -> (令牌数, 更新时间)
+
+    def acquire(self, user: str) -> float:
+        """尝试消耗一个令牌；成功返回0，否则返回需要等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(user, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+            if tokens >= 1.0:
+                tokens -= 1.0
+                wait = 0.0
+            else:
+                wait = (1.0 - tokens) / self.rate
+            self._buckets[user] = (tokens, now)
+            while len(self._buckets) > self.max_users:
+                self._buckets.popitem(last=False)
+        return wait
+
+class ConcurrencyGate:
+    """重操作的全局并发上限与有界等待队列"""
+
+    def __init__(self, max_active: int, max_waiting: int, wait_timeout: float):
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+
+    def acquire(self) -> bool:
+        """获取执行名额；队列已满或等待超时返回False"""
+        with self._cond:
+            if self.active < self.max_active:
+                self.active += 1
+                return True
+            if self.waiting >= self.max_waiting:
+                return False
+
+            self.waiting += 1
+            try:
+                if not self._cond.wait_for(lambda: self.active < self.max_active, timeout=self.wait_timeout):
+                    return False
+                self.active += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+class AdmissionControl:
+    """/refresh、/reset 等重命令的准入控制：先按用户限流，再排队等待全局执行名额
+
+    rate_per_minute <= 0 不限流；max_concurrency <= 0 不限并发。
+    """
+
+    RATE_LIMITED_REPLY = "操作过于频繁，请 {seconds} 秒后再试"
+    BUSY_REPLY = "系统繁忙，请稍后重试"
+
+    def __init__(self, rate_per_minute: float, burst: int, max_concurrency: int,
+                 max_queue: int, queue_timeout: float):
+        self.limiter = RateLimiter(rate_per_minute / 60.0, burst) if rate_per_minute > 0 else None
+        self.gate = ConcurrencyGate(max_concurrency, max_queue, queue_timeout) if max_concurrency > 0 else None
+
+    @contextmanager
+    def admit(self, user: str) -> Iterator[Optional[str]]:
+        """准入检查：放行时产出None并在退出时归还名额，拒绝时产出给用户的简短回复"""
+        if self.limiter is not None:
+            wait = self.limiter.acquire(user)
+            if wait > 0:
+                log.info(f"Rate limited {user}, retry after {wait:.1f}s")
+                yield self.RATE_LIMITED_REPLY.format(seconds=math.ceil(wait))
+                return
+
+        if self.gate is None:
+            yield None
+            return
+
+        if not self.gate.acquire():
+            log.warning(f"Shed heavy command from {user}: active={self.gate.active}, waiting={self.gate.waiting}")
+            yield self.BUSY_REPLY
+            return
+        try:
+            yield None
+        finally:
+            self.gate.release()
@@ -1,22 +1,42 @@
 # app/web/handlers.py
 import uuid
+import time
 import logging
-from flask import request, make_response, jsonify
+from contextlib import nullcontext
+from typing import Optional
+from flask import Response, request, make_response, jsonify
 from app.adapters.wecom.crypto import WeChatCryptoAdapter
 from core.registry.registry import SourceRegistry
 from core.refresh.engine import RefreshEngine
+from core.refresh.filters import parse_query
+from core.refresh.lease import Lease
+from app.web.admission import AdmissionControl
+from app.web.profiling import NULL_TRACE, RequestProfiler
 
 log = logging.getLogger(__name__)
 
+# 需要读写数据文件的命令，受准入控制
+HEAVY_COMMANDS = ("/refresh", "/reset", "/history")
+
 class WebhookHandler:
     """企业微信回调处理器"""
     
     def __init__(self, crypto_adapter: WeChatCryptoAdapter, 
                  registry: SourceRegistry, 
-                 refresh_engine: RefreshEngine):
+                 refresh_engine: RefreshEngine,
+                 refresh_budget: Optional[float] = None,
+                 admission: Optional[AdmissionControl] = None,
+                 profiler: Optional[RequestProfiler] = None,
+                 lease_ttl: Optional[float] = None,
+                 agent_id: int = 0):
         self.crypto = crypto_adapter
         self.registry = registry
         self.engine = refresh_engine
+        self.refresh_budget = refresh_budget  # /refresh 时间预算（秒），从收到请求开始计算
+        self.admission = admission
+        self.profiler = profiler
+        self.lease_ttl = lease_ttl  # 刷新租约有效期（秒），None为刷新时直接标记已推送
+        self.agent_id = agent_id    # 本处理器服务的应用ID（0为不校验）
     
     def handle_verification(self) -> tuple[str, int]:
         """处理URL验证"""
@@ -45,6 +65,7 @@ class WebhookHandler:
     def handle_message(self) -> tuple[str, int]:
         """处理用户消息"""
         rid = uuid.uuid4().hex[:8]
+        received = time.monotonic()
         
         msg_signature = request.args.get("msg_signature", "")
         timestamp = request.args.get("timestamp", "")
@@ -52,27 +73,69 @@ class WebhookHandler:
         
         log.info(f"[RID {rid}] Message received, content_length={request.content_length}")
         
-        try:
-            # 解密消息
-            msg = self.crypto.decrypt_message(request.data, msg_signature, timestamp, nonce)
-            
-            # 处理消息
-            reply_text = self._process_message(msg, rid)
-            reply = self.crypto.create_text_reply(reply_text, msg)
-            
-            # 加密回复
-            xml = self.crypto.encrypt_reply(reply, nonce, timestamp)
-            resp = make_response(xml)
-            resp.headers["Content-Type"] = "application/xml; charset=utf-8"
-            
-            log.info(f"[RID {rid}] Message processed successfully")
-            return resp, 200
-            
-        except Exception as e:
-            log.error(f"[RID {rid}] Message processing failed: {e}")
-            return f"message processing failed: {e}", 500
+        # 刷新领取的项在回复送达后才提交为已推送
+        lease = self.engine.begin_lease(self.lease_ttl) if self.lease_ttl else None
+        
+        capture = self.profiler.capture(rid) if self.profiler else nullcontext(NULL_TRACE)
+        with capture as trace:
+            try:
+                # 解密消息
+                with trace.stage("decrypt"):
+                    msg = self.crypto.decrypt_message(request.data, msg_signature, timestamp, nonce)
+                
+                # 同一企业的多个应用可能共用回调密钥：只处理发给本应用的消息
+                agent = getattr(msg, "agent", 0)
+                if self.agent_id and agent and agent != self.agent_id:
+                    log.warning(f"[RID {rid}] Message for agent {agent} ignored, expected {self.agent_id}")
+                    if lease is not None:
+                        self.engine.release_lease(lease)
+                    return "", 200
+                
+                # 处理消息
+                reply_text = self._process_message(msg, rid, received, trace, lease)
+                
+                # 加密回复
+                with trace.stage("encrypt"):
+                    reply = self.crypto.create_text_reply(reply_text, msg)
+                    xml = self.crypto.encrypt_reply(reply, nonce, timestamp)
+                resp = self._deliver(xml, lease, rid) if lease is not None else make_response(xml)
+                resp.headers["Content-Type"] = "application/xml; charset=utf-8"
+                
+                log.info(f"[RID {rid}] Message processed successfully")
+                return resp, 200
+                
+            except Exception as e:
+                trace.tag("error", str(e))
+                log.error(f"[RID {rid}] Message processing failed: {e}")
+                if lease is not None:
+                    self.engine.release_lease(lease)
+                return f"message processing failed: {e}", 500
+    
+    def _deliver(self, xml: str, lease: Lease, rid: str) -> Response:
+        """构造回复并在送达后提交租约
+
+        响应体由生成器产出：WSGI 服务器写完响应体后才会继续迭代生成器，此时提交租约；
+        写出失败或连接中断时生成器不会走到提交，关闭响应时释放租约。
+        """
+        body = xml.encode("utf-8")
+        delivered = []
+        
+        def stream():
+            yield body
+            delivered.append(True)
+            self.engine.commit_lease(lease)
+        
+        def on_close():
+            if not delivered:
+                log.warning(f"[RID {rid}] Reply not delivered, releasing lease {lease.id}")
+                self.engine.release_lease(lease)
+        
+        resp = Response(stream(), headers={"Content-Length": str(len(body))})
+        resp.call_on_close(on_close)
+        return resp
     
-    def _process_message(self, msg, rid: str) -> str:
+    def _process_message(self, msg, rid: str, received: Optional[float] = None, trace=NULL_TRACE,
+                         lease: Optional[Lease] = None) -> str:
         """处理具体的消息逻辑"""
         if msg.type != "text":
             log.info(f"[RID {rid}] Non-text message type: {msg.type}")
@@ -80,18 +143,40 @@ class WebhookHandler:
         
         content = (msg.content or "").strip()
         log.info(f"[RID {rid}] Text message: {content}")
+        trace.tag("command", content.split()[0] if content else "")
         
-        # 解析命令
+        # 重命令：按用户限流，并排队等待全局执行名额
+        if self.admission is not None and content.startswith(HEAVY_COMMANDS):
+            user = f"{self.crypto.corp_id}:{msg.source}"
+            t0 = time.perf_counter()
+            with self.admission.admit(user) as rejected:
+                trace.record("admission", (time.perf_counter() - t0) * 1000)
+                if rejected:
+                    trace.tag("rejected", rejected)
+                    log.info(f"[RID {rid}] Rejected by admission control: {rejected}")
+                    return rejected
+                with trace.stage("command"):
+                    return self._dispatch(content, rid, received, lease)
+        
+        with trace.stage("command"):
+            return self._dispatch(content, rid, received, lease)
+    
+    def _dispatch(self, content: str, rid: str, received: Optional[float] = None,
+                  lease: Optional[Lease] = None) -> str:
+        """分派命令"""
         if content.startswith("/refresh"):
-            return self._handle_refresh_command(content, rid)
+            return self._handle_refresh_command(content, rid, received, lease)
         elif content.startswith("/bots"):
             return self._handle_bots_command(rid)
         elif content.startswith("/reset"):
             return self._handle_reset_command(content, rid)
+        elif content.startswith("/history"):
+            return self._handle_history_command(content, rid)
         else:
             return self._get_help_text()
     
-    def _handle_refresh_command(self, content: str, rid: str) -> str:
+    def _handle_refresh_command(self, content: str, rid: str, received: Optional[float] = None,
+                                lease: Optional[Lease] = None) -> str:
         """处理刷新命令"""
         parts = content.split()
         
@@ -99,7 +184,10 @@ class WebhookHandler:
         if len(parts) == 1:
             # /refresh - 刷新所有源
             sources = self.registry.get_enabled_sources()
-            result = self.engine.refresh_multiple_sources(sources)
+            # 预算从收到请求起算，排队等待的时间也计入
+            start = received if received is not None else time.monotonic()
+            deadline = start + self.refresh_budget if self.refresh_budget else None
+            result = self.engine.refresh_multiple_sources(sources, deadline=deadline, lease=lease)
             log.info(f"[RID {rid}] Refresh all sources: {len(sources)} sources")
             return result
         
@@ -114,8 +202,16 @@ class WebhookHandler:
         if not source.enabled:
             return f"源 '{name_key}' 已禁用"
         
-        result = self.engine.refresh_source(source)
-        log.info(f"[RID {rid}] Refresh source {name_key}")
+        # /refresh <name_key> field=value ... limit=N - 条件刷新
+        query = None
+        if len(parts) > 2:
+            try:
+                query = parse_query(parts[2:])
+            except ValueError as e:
+                return str(e)
+        
+        result = self.engine.refresh_source(source, query=query, lease=lease)
+        log.info(f"[RID {rid}] Refresh source {name_key}" + (f" where {query}" if query else ""))
         return result
     
     def _handle_bots_command(self, rid: str) -> str:
@@ -128,7 +224,7 @@ class WebhookHandler:
         for name_key, source in sources.items():
             status = "启用" if source.enabled else "禁用"
             dot_info = f" (key={source.dot_path})" if source.dot_path else ""
-            lines.append(f"- {name_key}: {source.file}{dot_info} [{status}]")
+            lines.append(f"- {name_key}: {source.location}{dot_info} [{status}]")
         
         log.info(f"[RID {rid}] List bots: {len(sources)} sources")
         return "\n".join(lines)
@@ -138,16 +234,28 @@ class WebhookHandler:
         parts = content.split()
         
         if len(parts) < 2:
-            return "用法: /reset <源名称|all>"
+            return "用法: /reset <源名称|all> [条件...]"
         
         target = parts[1].strip()
         
+        # /reset <name> archive ... - 同时恢复归档中的项
+        include_archive = len(parts) > 2 and parts[2] == "archive"
+        if include_archive:
+            parts = parts[:2] + parts[3:]
+        
+        query = None
+        if len(parts) > 2:
+            try:
+                query = parse_query(parts[2:])
+            except ValueError as e:
+                return str(e)
+        
         if target == "all":
             # 重置所有源
             sources = self.registry.get_enabled_sources()
             results = []
             for name_key, source in sources.items():
-                result = self.engine.reset_source(source)
+                result = self.engine.reset_source(source, query=query, include_archive=include_archive)
                 if not result.startswith("[ERR]"):
                     results.append(result)
             
@@ -163,21 +271,50 @@ class WebhookHandler:
                 available = ", ".join(self.registry.list_sources().keys())
                 return f"源 '{target}' 不存在。可用源: {available}"
             
-            result = self.engine.reset_source(source)
-            log.info(f"[RID {rid}] Reset source {target}")
+            result = self.engine.reset_source(source, query=query, include_archive=include_archive)
+            log.info(f"[RID {rid}] Reset source {target}" + (f" where {query}" if query else ""))
             return result
     
+    def _handle_history_command(self, content: str, rid: str) -> str:
+        """处理历史查询命令（含已归档项）"""
+        parts = content.split()
+        
+        if len(parts) < 2:
+            return "用法: /history <源名称> [条件...]"
+        
+        name_key = parts[1].strip()
+        source = self.registry.get_source(name_key)
+        if not source:
+            available = ", ".join(self.registry.list_sources().keys())
+            return f"源 '{name_key}' 不存在。可用源: {available}"
+        
+        query = None
+        if len(parts) > 2:
+            try:
+                query = parse_query(parts[2:])
+            except ValueError as e:
+                return str(e)
+        
+        result = self.engine.history(source, query=query)
+        log.info(f"[RID {rid}] History of {name_key}" + (f" where {query}" if query else ""))
+        return result
+    
     def _get_help_text(self) -> str:
         """获取帮助文本"""
         return (
             "可用命令:\n"
             "/refresh - 刷新所有数据源\n"
-            "/refresh <源名称> - 刷新指定数据源\n"
+            "/refresh <源名称> [条件...] - 刷新指定数据源\n"
             "/bots - 列出所有已注册数据源\n"
-            "/reset <源名称|all> - 重置推送状态\n"
+            "/reset <源名称|all> [archive] [条件...] - 重置推送状态（archive: 同时恢复归档项）\n"
+            "/history <源名称> [条件...] - 查询已推送的历史项（含归档，默认20条）\n"
+            "条件: 字段=值 / 字段!=值 / 字段>=数值 ... / limit=N\n"
             "\n示例:\n"
             "/refresh\n"
             "/refresh status\n"
+            "/refresh status severity=high limit=20\n"
             "/bots\n"
-            "/reset status"
+            "/reset status\n"
+            "/reset status id>=100\n"
+            "/history status id=42"
         )
\ No newline at end of file
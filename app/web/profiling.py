@@ -0,0 +1,127 @@
+# app/web/profiling.py
+"""
+按需性能剖析
+
+- 采样：每 N 个回调请求用 cProfile 剖析一个（同一时刻最多剖析一个请求）
+- 慢请求：总耗时超过阈值的请求写入分阶段耗时；若该请求正在被剖析，同时写入 .prof
+- 输出目录只保留最近 keep 份，`manage_bot.py profiles` 汇总
+"""
+import json
+import time
+import cProfile
+import itertools
+import threading
+import logging
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+class RequestTrace:
+    """单个请求的分阶段耗时"""
+
+    def __init__(self, rid: str):
+        self.rid = rid
+        self.stages: List[Dict] = []
+        self.tags: Dict[str, str] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - t0) * 1000)
+
+    def record(self, name: str, ms: float):
+        """记录一个已测得的阶段"""
+        self.stages.append({"name": name, "ms": round(ms, 3)})
+
+    def tag(self, key: str, value: str):
+        """附加说明（如命令名）"""
+        self.tags[key] = value
+
+class _NullTrace:
+    """未开启剖析时的空实现"""
+
+    def stage(self, name: str):
+        return nullcontext()
+
+    def record(self, name: str, ms: float):
+        pass
+
+    def tag(self, key: str, value: str):
+        pass
+
+NULL_TRACE = _NullTrace()
+
+class RequestProfiler:
+    """回调请求剖析器（进程内共享）"""
+
+    def __init__(self, dump_dir: Path, sample_every: int = 0,
+                 slow_ms: Optional[float] = None, keep: int = 100):
+        self.dump_dir = Path(dump_dir)
+        self.sample_every = sample_every  # 0为不采样，可由管理路由在运行时调整
+        self.slow_ms = slow_ms
+        self.keep = keep
+        self._counter = itertools.count(1)
+        self._busy = threading.Lock()  # 同一时刻只剖析一个请求
+        self._write_lock = threading.Lock()
+
+    def _should_sample(self) -> bool:
+        every = self.sample_every
+        return every > 0 and next(self._counter) % every == 0
+
+    @contextmanager
+    def capture(self, rid: str) -> Iterator[RequestTrace]:
+        """包裹一个请求：按需开启cProfile，结束后判断是否写入"""
+        trace = RequestTrace(rid)
+        profile = None
+        if self._should_sample() and self._busy.acquire(blocking=False):
+            profile = cProfile.Profile()
+            profile.enable()
+
+        t0 = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            total_ms = (time.perf_counter() - t0) * 1000
+            if profile is not None:
+                profile.disable()
+                self._busy.release()
+
+            slow = self.slow_ms is not None and total_ms >= self.slow_ms
+            if slow or profile is not None:
+                try:
+                    self._write(trace, total_ms, profile, "slow" if slow else "sampled")
+                except Exception as e:
+                    log.error(f"[RID {rid}] Failed to write profile: {e}")
+
+    def _write(self, trace: RequestTrace, total_ms: float, profile: Optional[cProfile.Profile], reason: str):
+        """写入分阶段耗时（及剖析数据），并轮转旧文件"""
+        stem = f"{time.strftime('%Y%m%dT%H%M%S')}-{trace.rid}"
+        record = {
+            "rid": trace.rid,
+            "time": int(time.time()),
+            "reason": reason,
+            "total_ms": round(total_ms, 3),
+            "stages": trace.stages,
+            "tags": trace.tags,
+            "profile": f"{stem}.prof" if profile is not None else None,
+        }
+        with self._write_lock:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            if profile is not None:
+                profile.dump_stats(str(self.dump_dir / f"{stem}.prof"))
+            with open(self.dump_dir / f"{stem}.json", "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            self._rotate()
+        log.info(f"[RID {trace.rid}] Profile captured ({reason}, {total_ms:.1f} ms) -> {self.dump_dir / stem}")
+
+    def _rotate(self):
+        """只保留最近 keep 份"""
+        records = sorted(self.dump_dir.glob("*.json"), key=lambda p: p.stat().st_mtime_ns)
+        for old in records[:max(0, len(records) - self.keep)]:
+            old.unlink(missing_ok=True)
+            old.with_suffix(".prof").unlink(missing_ok=True)
@@ -1,9 +1,15 @@
 # app/web/routes.py
+import hmac
+import time
+from typing import Dict, Optional
 from flask import Blueprint, jsonify
 from app.web.handlers import WebhookHandler
 
-def create_webhook_blueprint(handler: WebhookHandler) -> Blueprint:
+def create_webhook_blueprint(handler: WebhookHandler,
+                             tenants: Optional[Dict[str, WebhookHandler]] = None) -> Blueprint:
     """创建企业微信回调蓝图"""
+    tenants = tenants or {}
+    
     bp = Blueprint('wecom', __name__, url_prefix='/wecom')
     
     @bp.route('/echo')
@@ -31,6 +37,41 @@ def create_webhook_blueprint(handler: WebhookHandler) -> Blueprint:
             "local_sig": local_sig
         })
     
+    @bp.route('/admin/profile')
+    def admin_profile():
+        """调整剖析采样率（管理用）
+
+        与回调相同的签名校验：msg_signature = sha1(sort(token, timestamp, nonce, echostr))，
+        echostr 为 "every=N"（N=0 关闭采样），timestamp 须在5分钟内。
+        """
+        from flask import request
+        profiler = handler.profiler
+        if profiler is None:
+            return "profiling disabled", 404
+        
+        msg_signature = request.args.get("msg_signature", "")
+        timestamp = request.args.get("timestamp", "")
+        nonce = request.args.get("nonce", "")
+        echostr = request.args.get("echostr", "")
+        
+        local_sig = handler.crypto.calculate_local_signature(timestamp, nonce, echostr)
+        if not hmac.compare_digest(local_sig, msg_signature):
+            return "signature verify failed", 403
+        if not timestamp.isdigit() or abs(time.time() - int(timestamp)) > 300:
+            return "timestamp expired", 403
+        
+        if echostr:
+            key, _, value = echostr.partition("=")
+            if key != "every" or not value.isdigit():
+                return "echostr must be every=N", 400
+            profiler.sample_every = int(value)
+        
+        return jsonify({
+            "sample_every": profiler.sample_every,
+            "slow_ms": profiler.slow_ms,
+            "dump_dir": str(profiler.dump_dir)
+        })
+    
     @bp.route('/callback', methods=['GET', 'POST'])
     def callback():
         """企业微信回调处理"""
@@ -41,4 +82,18 @@ def create_webhook_blueprint(handler: WebhookHandler) -> Blueprint:
         else:
             return handler.handle_message()
     
+    @bp.route('/<tenant>/callback', methods=['GET', 'POST'])
+    def tenant_callback(tenant: str):
+        """多租户回调处理"""
+        from flask import request
+        
+        tenant_handler = tenants.get(tenant)
+        if tenant_handler is None:
+            return f"unknown tenant: {tenant}", 404
+        
+        if request.method == 'GET':
+            return tenant_handler.handle_verification()
+        else:
+            return tenant_handler.handle_message()
+    
     return bp
\ No newline at end of file
@@ -6,10 +6,50 @@ import re
 import base64
 import logging
 from pathlib import Path
+from typing import Dict, List, Optional
 from pydantic import BaseModel, field_validator
 
 log = logging.getLogger(__name__)
 
+def _check_corp_id(v: str) -> str:
+    if not (v and v.startswith("ww")):
+        raise ValueError("corp_id must start with 'ww'")
+    return v
+
+def _check_aes_key(v: str) -> str:
+    if not re.fullmatch(r"[A-Za-z0-9]{43}", v or ""):
+        raise ValueError("aes_key must be 43 alnum chars")
+    try:
+        if len(base64.b64decode((v or "") + "=")) != 32:
+            raise ValueError("aes_key base64 decode != 32 bytes")
+    except Exception as e:
+        raise ValueError(f"aes_key invalid base64: {e}")
+    return v
+
+class TenantSettings(BaseModel):
+    """租户配置：同一进程内服务的一个企业微信应用"""
+    corp_id: str                                  # 企业ID
+    token: str                                    # 验证Token
+    aes_key: str                                  # 加密密钥
+    agent_id: int = 0                            # 应用ID
+    bot_registry_file: str                        # 租户自己的注册表文件
+    json_base_dir: Optional[Path] = None          # JSON目录（缺省沿用全局配置）
+    
+    @field_validator("corp_id")
+    @classmethod
+    def validate_corp_id(cls, v: str) -> str:
+        return _check_corp_id(v)
+    
+    @field_validator("aes_key")
+    @classmethod
+    def validate_aes_key(cls, v: str) -> str:
+        return _check_aes_key(v)
+    
+    @field_validator("json_base_dir", mode="before")
+    @classmethod
+    def validate_base_dir(cls, v) -> Optional[Path]:
+        return Path(v).expanduser().resolve() if v else None
+
 class Settings(BaseModel):
     """配置设置"""
     # 企业微信配置
@@ -22,31 +62,52 @@ class Settings(BaseModel):
     json_base_dir: Path = Path("./data")         # JSON文件基础目录
     default_json_file: str = "status.json"       # 默认JSON文件
     bot_registry_file: str = "config/bot_registry.json"  # 注册表文件
+    refresh_budget_seconds: Optional[float] = 4.0  # /refresh 时间预算（企业微信被动回复需在5秒内返回，None为不限）
+    http_max_per_host: int = 4                    # 远程源：每个主机的最大并发连接数
+    http_timeout_seconds: float = 10.0            # 远程源：请求超时
+    rate_limit_per_minute: float = 20.0           # 每个用户每分钟可执行的重命令数（/refresh /reset /history，0为不限）
+    rate_limit_burst: int = 5                     # 每个用户可连续执行的重命令数
+    heavy_max_concurrency: int = 4                # 全局同时执行的重命令数（0为不限）
+    heavy_max_queue: int = 8                      # 等待执行名额的最大请求数，超出直接回复繁忙
+    heavy_queue_timeout_seconds: float = 2.0      # 排队最长等待时间（计入刷新时间预算）
+    profile_dir: Optional[str] = None             # 剖析输出目录（None为关闭剖析）
+    profile_sample_every: int = 0                 # 每N个回调剖析一个（0为不采样，可由管理路由调整）
+    profile_slow_ms: Optional[float] = None       # 超过该耗时的请求写入分阶段耗时
+    profile_keep: int = 100                       # 剖析目录保留的最近份数
+    crypto_fast_path: bool = True                 # 回调加解密使用快速路径（False 回退到 wechatpy）
+    lease_ttl_seconds: Optional[float] = 60.0     # 刷新租约有效期：回复送达后才标记已推送，超时未确认则退回（None为立即标记）
+    compaction_retention_days: Optional[float] = None  # 已推送项保留天数，超过后归档（None为不归档）
+    compaction_interval_seconds: int = 0          # 定时归档间隔（0为不定时，仅手动执行）
+    dedup_window_seconds: Optional[float] = None  # 跨源去重窗口：该时间内投递过的相同项不再播报（None为不去重，0为只在一次回复内去重）
+    dedup_fields: List[str] = []                  # 去重键字段（为空时按对象完整内容去重）
+    dedup_max_entries: int = 50000                # 去重指纹索引保留的最大指纹数
+    
+    # 多租户：路由 /wecom/<租户名>/callback
+    tenants: Dict[str, TenantSettings] = {}
     
     @field_validator("corp_id")
     @classmethod
     def validate_corp_id(cls, v: str) -> str:
-        if not (v and v.startswith("ww")):
-            raise ValueError("corp_id must start with 'ww'")
-        return v
+        return _check_corp_id(v)
     
     @field_validator("aes_key")
     @classmethod
     def validate_aes_key(cls, v: str) -> str:
-        if not re.fullmatch(r"[A-Za-z0-9]{43}", v or ""):
-            raise ValueError("aes_key must be 43 alnum chars")
-        try:
-            if len(base64.b64decode((v or "") + "=")) != 32:
-                raise ValueError("aes_key base64 decode != 32 bytes")
-        except Exception as e:
-            raise ValueError(f"aes_key invalid base64: {e}")
-        return v
+        return _check_aes_key(v)
     
     @field_validator("json_base_dir", mode="before")
     @classmethod
     def validate_base_dir(cls, v) -> Path:
         return Path(v or "./data").expanduser().resolve()
     
+    @field_validator("tenants")
+    @classmethod
+    def validate_tenants(cls, v: Dict[str, TenantSettings]) -> Dict[str, TenantSettings]:
+        for name in v:
+            if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+                raise ValueError(f"tenant name must be [A-Za-z0-9_-]+: {name!r}")
+        return v
+    
     @classmethod
     def load(cls, config_file: str = None) -> Settings:
         """加载配置文件"""
@@ -97,6 +158,9 @@ class Settings(BaseModel):
         log.info(f"  aes_key: {mask(self.aes_key)} (len={len(self.aes_key or '')})")
         log.info(f"  json_base_dir: {self.json_base_dir}")
         log.info(f"  default_json_file: {self.default_json_file}")
+        for name, tenant in self.tenants.items():
+            log.info(f"  tenant {name}: corp_id={mask(tenant.corp_id)} "
+                     f"agent_id={tenant.agent_id} registry={tenant.bot_registry_file}")
         
         if errors:
             error_msg = "Configuration validation failed:\n" + "\n".join(f"  - {err}" for err in errors)
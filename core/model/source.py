@@ -1,16 +1,25 @@
 # core/model/source.py
 from __future__ import annotations
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, field_validator, model_validator
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
+
+SOURCE_KINDS = ("file", "glob", "http")
+TRANSFORMS = ("digest",)
 
 class Source(BaseModel):
     """数据源模型：包含文件路径、键路径等信息"""
     name_key: str                    # 源别名
-    file: str                        # 相对路径
+    file: Optional[str] = None       # 相对路径，glob类型为通配模式（file/glob类型必填）
     dot_path: Optional[str] = None   # 点路径（可选）
     enabled: bool = True             # 是否启用
-    transform: Optional[str] = None  # 预留格式化器
+    transform: Optional[str] = None  # 输出格式：None 逐项列出 | digest 按字段汇总
+    weight: float = 0.0              # 刷新优先级（越大越先刷新）
+    kind: str = "file"               # 源类型: file | glob | http
+    url: Optional[str] = None        # 远程地址（http类型必填）
+    index_fields: List[str] = []     # 二级索引字段（file类型，用于条件刷新/重置）
+    digest_fields: List[str] = []    # 摘要统计字段（transform=digest，为空时使用索引字段）
+    digest_top_k: int = 5            # 摘要中每个字段列出的取值个数
     
     @field_validator("name_key")
     @classmethod
@@ -21,10 +30,59 @@ class Source(BaseModel):
     
     @field_validator("file")
     @classmethod
-    def validate_file(cls, v: str) -> str:
-        if not v or not v.strip():
+    def validate_file(cls, v: Optional[str]) -> Optional[str]:
+        if v is None:
+            return v
+        if not v.strip():
             raise ValueError("file path cannot be empty")
         return v.strip()
+    
+    @field_validator("index_fields")
+    @classmethod
+    def validate_index_fields(cls, v: List[str]) -> List[str]:
+        fields = [f.strip() for f in v if f and f.strip()]
+        if "pushed" in fields or "pushed_at" in fields:
+            raise ValueError("pushed/pushed_at cannot be index fields")
+        return fields
+    
+    @field_validator("digest_fields")
+    @classmethod
+    def validate_digest_fields(cls, v: List[str]) -> List[str]:
+        return [f.strip() for f in v if f and f.strip()]
+    
+    @field_validator("transform")
+    @classmethod
+    def validate_transform(cls, v: Optional[str]) -> Optional[str]:
+        if v is None or not v.strip():
+            return None
+        if v.strip() not in TRANSFORMS:
+            raise ValueError(f"transform must be one of {TRANSFORMS}")
+        return v.strip()
+    
+    @field_validator("digest_top_k")
+    @classmethod
+    def validate_digest_top_k(cls, v: int) -> int:
+        if v < 1:
+            raise ValueError("digest_top_k must be >= 1")
+        return v
+    
+    @model_validator(mode="after")
+    def validate_kind(self) -> Source:
+        if self.kind not in SOURCE_KINDS:
+            raise ValueError(f"kind must be one of {SOURCE_KINDS}")
+        if self.kind == "http":
+            if not (self.url and self.url.startswith(("http://", "https://"))):
+                raise ValueError("http source requires an http(s) url")
+        elif not self.file:
+            raise ValueError("file path cannot be empty")
+        elif self.kind == "file" and any(c in self.file for c in "*?["):
+            self.kind = "glob"
+        return self
+    
+    @property
+    def location(self) -> str:
+        """用于展示的数据位置"""
+        return self.url if self.kind == "http" else self.file
 
 class Item(BaseModel):
     """更新项模型：JSON中的一个对象"""
@@ -0,0 +1,53 @@
+# core/refresh/archive.py
+"""
+已推送项的归档段：与数据文件同目录的 gzip JSON Lines 文件
+
+    status.json.archive.20261018T120000.jsonl.gz
+
+每行一条记录 {"loc": 定位符, "dot_path": 点路径, "item": 对象}，
+dict 集合的定位符为键，恢复时写回原键；列表的定位符无意义，恢复时追加到末尾。
+"""
+import gzip
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+SEGMENT_MARKER = ".archive."
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def segment_paths(json_path: Path) -> List[Path]:
+    """数据文件的所有归档段，按时间从新到旧"""
+    prefix = json_path.name + SEGMENT_MARKER
+    paths = [p for p in json_path.parent.glob(prefix + "*" + SEGMENT_SUFFIX)]
+    return sorted(paths, reverse=True)
+
+
+def read_segment(path: Path) -> Iterator[Dict]:
+    """流式读取归档段"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def write_segment(path: Path, records: List[Dict]):
+    """原子写入归档段"""
+    tmp = path.with_name(path.name + ".tmp")
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, sort_keys=True))
+            f.write("\n")
+    tmp.replace(path)
+
+
+def new_segment_path(json_path: Path) -> Path:
+    """生成新的归档段路径（同一秒内重复压缩时追加序号）"""
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    path = json_path.with_name(f"{json_path.name}{SEGMENT_MARKER}{stamp}{SEGMENT_SUFFIX}")
+    seq = 1
+    while path.exists():
+        path = json_path.with_name(f"{json_path.name}{SEGMENT_MARKER}{stamp}-{seq}{SEGMENT_SUFFIX}")
+        seq += 1
+    return path
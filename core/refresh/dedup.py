@@ -0,0 +1,194 @@
+# core/refresh/dedup.py
+"""
+跨源去重：丢弃同一次回复内、以及时间窗口内已投递过的重复项
+
+指纹：配置了键字段时为这些字段取值的哈希；否则为对象规范化 JSON（不含 pushed）的哈希。
+回复中该项的文本与 RefreshEngine._format_items 中的相同（见 _format_texts）。
+规范化 JSON 与回复文本由同一次序列化得到（见 item_texts），每项只序列化一次。
+已投递的指纹保存在有界的磁盘索引中（最多 max_entries 个，超出淘汰最早的），
+通过租约投递的指纹在租约提交后才生效，释放时丢弃。
+"""
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from core.refresh.filecache import FileCache
+from core.refresh.lease import Lease
+
+FINGERPRINT_CHARS = 16  # 指纹取SHA1前64位，索引体积减半，碰撞概率可忽略
+
+# 与 json.dumps(ensure_ascii=False, indent=2, sort_keys=True) 相同，复用编码器省去每次构造
+_dumps = json.JSONEncoder(ensure_ascii=False, indent=2, sort_keys=True).encode
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:FINGERPRINT_CHARS]
+
+def item_texts(item: Dict) -> Tuple[str, str]:
+    """一次序列化得到 (回复文本, 规范化 JSON)
+
+    回复文本即 json.dumps(item, indent=2, sort_keys=True)；规范化 JSON 为不含 pushed
+    （投递状态而非内容）的同一序列化。对象有 pushed 字段时只序列化其余内容，
+    再把 pushed 一行按键序插入得到回复文本。
+    """
+    if "pushed" not in item:
+        text = _dumps(item)
+        return text, text
+    
+    content = {k: v for k, v in item.items() if k != "pushed"}
+    canonical = _dumps(content)
+    pushed = item["pushed"]
+    if isinstance(pushed, bool):
+        entry = '  "pushed": ' + ("true" if pushed else "false")
+    else:
+        entry = '  "pushed": ' + _dumps(pushed).replace("\n", "\n  ")
+    if not content:
+        return "{\n" + entry + "\n}", canonical
+    
+    # 顶层键各占一行且恰好缩进两格（字符串中的换行已被转义），可以直接定位插入点
+    later = [k for k in content if k > "pushed"]
+    if not later:
+        return canonical[:-2] + ",\n" + entry + "\n}", canonical
+    pos = canonical.index("\n  " + json.dumps(min(later), ensure_ascii=False) + ": ")
+    return canonical[:pos] + "\n" + entry + "," + canonical[pos:], canonical
+
+class Deduplicator:
+    """指纹去重与已投递指纹索引（进程内共享，跨进程通过文件锁与文件指纹同步）
+
+    window 为 0 时只在一次回复内去重，不读写磁盘索引。
+    """
+
+    def __init__(self, path: Path, fields: Optional[List[str]] = None, window: float = 0.0,
+                 max_entries: int = 50000, cache: Optional[FileCache] = None,
+                 lock_dir: Optional[Path] = None):
+        self.path = path
+        self.fields = list(fields or [])
+        self.window = window
+        self.max_entries = max_entries
+        self.cache = cache or FileCache()
+        self.lock_dir = lock_dir
+        self._entries: "OrderedDict[str, float]" = OrderedDict()  # 指纹 -> 投递时间（从早到晚）
+        self._leases: Dict[str, Dict] = {}  # 租约ID -> {"expires": 到期时间, "fps": 租约中投递的指纹}
+        self._loaded: Optional[Tuple[int, int]] = None  # 已加载的索引文件指纹
+
+    def key_fingerprint(self, item: Dict) -> Optional[str]:
+        """键字段的指纹；未配置键字段或对象缺少全部键字段时为None（改用内容哈希）"""
+        if self.fields:
+            key = [item.get(f) for f in self.fields]
+            if any(v is not None for v in key):
+                return _hash(json.dumps(key, ensure_ascii=False, sort_keys=True, default=str))
+        return None
+
+    def fingerprint(self, item: Dict) -> Tuple[str, str]:
+        """(项的指纹, 回复文本)：只在需要内容哈希时计算规范化 JSON"""
+        fp = self.key_fingerprint(item)
+        if fp is not None:
+            return fp, _dumps(item)
+        text, canonical = item_texts(item)
+        return _hash(canonical), text
+
+    def forget(self, items: List[Dict]):
+        """从索引中移除这些项的指纹（/reset 主动重新投递的项不应被当作重复丢弃）"""
+        if self.window <= 0 or not items:
+            return
+        fps = set()
+        for item in items:
+            fp = self.key_fingerprint(item)
+            fps.add(fp if fp is not None else _hash(item_texts(item)[1]))
+        
+        with self.cache.lock(self.path, self.lock_dir):
+            self._reload(time.time())
+            removed = [fp for fp in fps if self._entries.pop(fp, None) is not None]
+            if removed:
+                self._save()
+
+    def filter(self, items: List[Dict], lease: Optional[Lease] = None,
+               seen: Optional[Set[str]] = None) -> Tuple[List[str], int]:
+        """去重并返回 (保留项的 JSON 文本, 丢弃数量)
+
+        seen 为本次回复中已出现的指纹（多个源共用），保留项的指纹会加入其中；
+        保留项同时记入磁盘索引（给出租约时先挂在租约下）。
+        """
+        seen = set() if seen is None else seen
+        if self.window <= 0:
+            texts, dropped, _ = self._filter(items, seen, set())
+            return texts, dropped
+
+        with self.cache.lock(self.path, self.lock_dir):
+            now = time.time()
+            self._reload(now)
+            held = {fp for entry in self._leases.values() for fp in entry["fps"]}
+            texts, dropped, fresh = self._filter(items, seen, held)
+            if fresh:
+                if lease is None:
+                    for fp in fresh:
+                        self._entries[fp] = now
+                else:
+                    entry = self._leases.setdefault(lease.id, {"expires": lease.expires, "fps": []})
+                    entry["fps"].extend(fresh)
+                self._save()
+        return texts, dropped
+
+    def _filter(self, items: List[Dict], seen: Set[str], held: Set[str]) -> Tuple[List[str], int, List[str]]:
+        texts = []
+        fresh = []
+        dropped = 0
+        for item in items:
+            fp, text = self.fingerprint(item)
+            if fp in seen or fp in held or fp in self._entries:
+                dropped += 1
+                continue
+            seen.add(fp)
+            texts.append(text)
+            fresh.append(fp)
+        return texts, dropped, fresh
+
+    def settle(self, lease: Lease, commit: bool):
+        """结束租约：提交时指纹正式记入索引，释放时丢弃"""
+        if self.window <= 0:
+            return
+        with self.cache.lock(self.path, self.lock_dir):
+            now = time.time()
+            self._reload(now)
+            entry = self._leases.pop(lease.id, None)
+            if entry is None:
+                return
+            if commit:
+                for fp in entry["fps"]:
+                    self._entries.pop(fp, None)
+                    self._entries[fp] = now
+            self._save()
+
+    def _reload(self, now: float):
+        """索引文件被其他进程改写过时重新加载，并清理过期的指纹与租约"""
+        fp = self.cache.fingerprint(self.path)
+        if fp != self._loaded:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except FileNotFoundError:
+                state = {}
+            self._entries = OrderedDict(state.get("entries", []))
+            self._leases = state.get("leases", {})
+            self._loaded = fp
+
+        cutoff = now - self.window
+        while self._entries:
+            oldest = next(iter(self._entries))
+            if self._entries[oldest] >= cutoff:
+                break
+            del self._entries[oldest]
+        self._leases = {lid: entry for lid, entry in self._leases.items() if entry["expires"] > now}
+
+    def _save(self):
+        """淘汰超出上限的最早指纹后原子写入（内部文件，紧凑格式）"""
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        state = {"entries": list(self._entries.items()), "leases": self._leases}
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(self.path)
+        self._loaded = self.cache.fingerprint(self.path)
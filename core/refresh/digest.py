@@ -0,0 +1,144 @@
+# core/refresh/digest.py
+"""
+摘要模式（Source.transform = "digest"）：新增项很多时只回复按字段汇总的统计
+
+每个字段统计：出现次数、Top-K 取值（可合并的 Space-Saving 摘要，内存固定为 capacity 个计数器）、
+数值的最小/最大值。对象按批（batch_size 个）缓冲，逐字段取出一列后整列聚合：
+一列先按原始取值计数，规范化与数值解析只对不同取值做一次。
+总耗时与对象数成线性，内存与对象数无关。
+"""
+import heapq
+import threading
+from collections import Counter
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple
+from core.refresh.filters import index_key, numeric
+
+class SpaceSaving:
+    """Space-Saving 近似 Top-K：最多保留 capacity 个计数器
+
+    被淘汰的计数中最大的记为 floor，未保留的取值真实次数都不超过 floor；
+    新进入的取值按 floor 补足计数，补足的部分记录在 errors 中（计数只会偏大）。
+    出现次数超过 总数/capacity 的取值一定会被保留。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.floor = 0
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+
+    def update(self, batch: Dict[str, int]):
+        """合并一批取值计数，超出容量时整批淘汰计数最小的取值"""
+        counts, errors, floor = self.counts, self.errors, self.floor
+        for key, n in batch.items():
+            if key in counts:
+                counts[key] += n
+            else:
+                counts[key] = n + floor
+                errors[key] = floor
+        
+        if len(counts) > self.capacity:
+            kept = heapq.nlargest(self.capacity + 1, counts.items(), key=itemgetter(1))
+            self.floor = max(floor, kept.pop()[1])
+            self.counts = dict(kept)
+            self.errors = {key: errors[key] for key in self.counts}
+
+    def top(self, k: int) -> List[Tuple[str, int, int]]:
+        """前k个取值：(取值, 计数, 计数误差上限)，略去误差超过一半计数的取值（如连续数值）"""
+        ranked = sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(key, n, self.errors[key]) for key, n in ranked if n >= 2 * self.errors[key]][:k]
+
+class FieldStats:
+    """单个字段的统计"""
+
+    def __init__(self, capacity: int):
+        self.count = 0
+        self.minimum: Optional[float] = None
+        self.maximum: Optional[float] = None
+        self.top = SpaceSaving(capacity)
+
+    def add_column(self, column: List[Any]):
+        """聚合一列取值（None 表示对象没有该字段，对象/数组取值不参与统计）"""
+        try:
+            raw = Counter(column)
+        except TypeError:
+            raw = Counter(v for v in column if not isinstance(v, (dict, list)))
+        raw.pop(None, None)
+        if not raw:
+            return
+
+        batch: Dict[str, int] = {}
+        lo = hi = None
+        for v, n in raw.items():
+            self.count += n
+            # 与 index_key 相同的规范化，数值只解析一次
+            num = None if isinstance(v, bool) else numeric(v)
+            if num is None:
+                key = index_key(v)
+            else:
+                key = str(int(num)) if num.is_integer() else repr(num)
+                lo = num if lo is None else min(lo, num)
+                hi = num if hi is None else max(hi, num)
+            batch[key] = batch.get(key, 0) + n
+
+        if lo is not None:
+            self.minimum = lo if self.minimum is None else min(self.minimum, lo)
+            self.maximum = hi if self.maximum is None else max(self.maximum, hi)
+        self.top.update(batch)
+
+class Digest:
+    """未推送项的摘要（线程安全，目录源并行处理的文件可以共用一个）"""
+
+    def __init__(self, fields: List[str], top_k: int = 5, batch_size: int = 1024):
+        self.fields = list(fields)
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.total = 0
+        self.stats = {f: FieldStats(max(4 * top_k, 32)) for f in self.fields}
+        self._batch: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, item: Dict):
+        """加入一个对象（只缓冲引用，满一批后聚合）"""
+        with self._lock:
+            self.total += 1
+            self._batch.append(item)
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+
+    def _flush(self):
+        batch, self._batch = self._batch, []
+        for f, stats in self.stats.items():
+            stats.add_column([item.get(f) for item in batch])
+
+    def render(self, name_key: str, drill: bool = True) -> str:
+        """生成摘要回复；drill 为真时附带查看明细的 /history 命令（远程源没有本地历史）"""
+        with self._lock:
+            self._flush()
+
+        lines = [f"[摘要] {name_key}: 新增 {self.total} 项"]
+        hint = None
+        for f, stats in self.stats.items():
+            if not stats.count:
+                continue
+            top = stats.top.top(self.top_k)
+            line = f"{f} ({stats.count})"
+            if top:
+                parts = [f"{'≈' if err else ''}{key} {n}" for key, n, err in top]
+                rest = stats.count - sum(n for _, n, _ in top)
+                if rest > 0:
+                    parts.append(f"其他 {rest}")
+                line += ": " + " · ".join(parts)
+            lines.append(line)
+            if stats.minimum is not None:
+                lines.append(f"  {f} 范围: {_fmt(stats.minimum)} ~ {_fmt(stats.maximum)}")
+            if hint is None and top and " " not in top[0][0]:
+                hint = f"/history {name_key} {f}={top[0][0]} limit=20"
+
+        if drill:
+            lines.append(f"查看明细: {hint or f'/history {name_key} limit=20'}")
+        return "\n".join(lines)
+
+def _fmt(n: float) -> str:
+    return str(int(n)) if n.is_integer() else f"{n:g}"
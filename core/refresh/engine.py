@@ -1,18 +1,63 @@
 # core/refresh/engine.py
 import json
 import re
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, Iterable, Iterator, List, Optional, Any, Tuple, Union
 from core.model.source import Source
+from core.refresh.filecache import FileCache
+from core.refresh.http_source import HttpConnectionPool
+from core.refresh.filters import Query
+from core.refresh.digest import Digest
+from core.refresh.dedup import Deduplicator
+from core.refresh.index import SourceIndex, status_is_valid
+from core.refresh.archive import SEGMENT_MARKER, new_segment_path, read_segment, segment_paths, write_segment
+from core.refresh.lease import LEASE_FIELD, Lease, active_lease_id
 import logging
 
 log = logging.getLogger(__name__)
 
+def state_name(name_key: str) -> str:
+    """源名称对应的状态文件名：只含字母数字、下划线、连字符与点（不以点开头）的名称原样使用，
+    其他名称（含路径分隔符、..等）替换非法字符并附加哈希，保证不逃逸出状态目录且互不冲突"""
+    if re.fullmatch(r"[\w-][\w.-]*", name_key):
+        return name_key
+    safe = re.sub(r"[^\w.-]", "_", name_key).lstrip(".")[:64]
+    return f"{safe}-{hashlib.sha1(name_key.encode('utf-8')).hexdigest()[:12]}"
+
 class RefreshEngine:
     """刷新引擎：读取→过滤→写回→渲染"""
     
-    def __init__(self, base_dir: Path):
+    def __init__(self, base_dir: Path, cache: Optional[FileCache] = None,
+                 http: Optional[HttpConnectionPool] = None, dedup_window: Optional[float] = None,
+                 dedup_fields: Optional[List[str]] = None, dedup_max_entries: int = 50000,
+                 namespace: Optional[str] = None):
         self.base_dir = base_dir
+        self.state_root = base_dir / ".bot_state"  # 数据目录下所有引擎状态的根目录
+        # 引擎自身的本地状态（远程源投递记录等）；多个租户共用数据目录时按租户隔离
+        self.state_dir = self.state_root if namespace is None else self.state_root / "tenants" / namespace
+        self.lock_dir = self.state_root / "locks"  # 文件锁（各租户共用，同一文件在所有进程中是同一把锁）
+        self.cache = cache or FileCache()
+        self.http = http or HttpConnectionPool()
+        self.glob_workers = 8                        # 目录源并行处理的文件数上限
+        self._last_activity: Dict[str, float] = {}  # 源最近一次产出更新的时间
+        self._durations: Dict[str, float] = {}      # 源刷新耗时的滑动平均（秒）
+        self._pending: set = set()                  # 上次因超时跳过、待继续的源
+        self._indexes: Dict[Path, SourceIndex] = {} # 二级索引（按索引状态文件缓存）
+        self._lease_lock = threading.Lock()
+        self._leased: Dict[str, List[Tuple[Source, Optional[Path], bool]]] = {}  # 租约ID -> 领取过的 (源, 文件, 是否索引)
+        # 跨源去重（dedup_window 为None时关闭，0 为只在一次回复内去重）
+        self.dedup = Deduplicator(
+            self.state_dir / "dedup" / "fingerprints.json", dedup_fields, dedup_window,
+            dedup_max_entries, self.cache, self.lock_dir
+        ) if dedup_window is not None else None
+    
+    def _lock(self, path: Path):
+        """文件锁（锁文件在 .bot_state/locks 下，不在数据目录中留下隐藏文件）"""
+        return self.cache.lock(path, self.lock_dir)
     
     def _safe_join(self, *paths: str) -> Path:
         """安全路径拼接，防止路径逃逸"""
@@ -60,54 +105,179 @@ class RefreshEngine:
             json.dump(data_obj, f, ensure_ascii=False, indent=2, sort_keys=True)
         tmp.replace(path)
     
-    def _collect_unpushed_items(self, target: Any) -> tuple[List[Dict], bool]:
-        """收集未推送项并标记为已推送"""
-        unpushed_items = []
-        changed = False
-        
-        def mark_and_collect_in_list(lst: List):
-            nonlocal changed
-            for i, item in enumerate(lst):
-                if isinstance(item, dict):
-                    if not item.get("pushed", False):
-                        unpushed_items.append(item.copy())
-                        lst[i]["pushed"] = True
-                        changed = True
-        
-        def mark_and_collect_in_dict(dct: Dict):
-            nonlocal changed
-            for k, v in dct.items():
-                if isinstance(v, dict):
-                    if not v.get("pushed", False):
-                        unpushed_items.append(v.copy())
-                        dct[k]["pushed"] = True
-                        changed = True
-        
+    def _iter_items(self, target: Any) -> Iterator[tuple[Any, Dict]]:
+        """遍历目标中的对象项，产出 (定位符, 对象)
+
+        定位符：列表为下标，对象集合为键，单个对象为None。
+        """
         if isinstance(target, list):
-            mark_and_collect_in_list(target)
+            for i, item in enumerate(target):
+                if isinstance(item, dict):
+                    yield i, item
         elif isinstance(target, dict):
             # 判断是对象集合还是单个对象
             is_collection = any(isinstance(v, dict) for v in target.values()) and len(target) > 1
             if is_collection:
-                mark_and_collect_in_dict(target)
+                for k, v in target.items():
+                    if isinstance(v, dict):
+                        yield k, v
             else:
-                # 单对象处理
-                if not target.get("pushed", False):
-                    unpushed_items.append(target.copy())
-                    target["pushed"] = True
-                    changed = True
+                yield None, target
         else:
             raise ValueError("Selected JSON must be list/dict (of objects).")
+    
+    def _item_at(self, target: Any, loc: Any) -> Optional[Dict]:
+        """按定位符取对象项"""
+        if loc is None:
+            return target if isinstance(target, dict) else None
+        if isinstance(target, list):
+            item = target[loc] if isinstance(loc, int) and 0 <= loc < len(target) else None
+        else:
+            item = target.get(loc)
+        return item if isinstance(item, dict) else None
+    
+    def _collect_unpushed_items(self, target: Any, query: Optional[Query] = None,
+                                locators: Optional[List[Any]] = None,
+                                lease: Optional[Lease] = None,
+                                digest: Optional[Digest] = None) -> tuple[List[Dict], List[Any], int]:
+        """收集未推送项并标记，返回 (未推送项, 被标记的定位符, 被其他租约占用而跳过的数量)
+
+        给出 locators 时只检查这些位置（来自索引），否则遍历整个目标。
+        lease 为空时直接标记为已推送；否则只写入租约，提交后才算已推送。
+        其他租约占用中的项跳过，租约过期的项视为未推送。
+        给出 digest 时未推送项只计入摘要，不复制到返回列表。
+        """
+        if locators is None:
+            pairs = self._iter_items(target)
+        else:
+            pairs = ((loc, self._item_at(target, loc)) for loc in locators)
         
-        return unpushed_items, changed
+        unpushed_items = []
+        marked = []
+        held = 0
+        limit = query.limit if query else None
+        now = time.time()
+        for loc, item in pairs:
+            if item is None or item.get("pushed", False):
+                continue
+            if active_lease_id(item, now) is not None:
+                held += 1
+                continue
+            if query and not query.matches(item):
+                continue
+            if digest is not None:
+                digest.add(item)
+            else:
+                output = item.copy()
+                output.pop(LEASE_FIELD, None)
+                unpushed_items.append(output)
+            if lease is None:
+                item.pop(LEASE_FIELD, None)
+                item["pushed"] = True
+                item["pushed_at"] = int(now)  # 推送时间，供归档压缩判断保留期
+            else:
+                item[LEASE_FIELD] = lease.to_dict()
+            marked.append(loc)
+            if limit is not None and len(marked) >= limit:
+                break
+        
+        return unpushed_items, marked, held
+    
+    def _state_file(self, kind: str, source: Source) -> Path:
+        """源的本地状态文件"""
+        return self.state_dir / kind / f"{state_name(source.name_key)}.json"
     
-    def refresh_source(self, source: Source) -> str:
-        """刷新单个数据源"""
+    def _load_state(self, path: Path) -> Dict:
+        """读取本地状态，不存在时返回空状态"""
         try:
-            json_path = self._safe_join(source.file)
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def _save_state(self, path: Path, state: Dict):
+        """原子写入本地状态（内部文件，紧凑格式）"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+        tmp.replace(path)
+    
+    def _item_key(self, item: Dict) -> str:
+        """远程对象的投递标识：优先使用id字段，否则为内容哈希"""
+        if "id" in item:
+            return f"id:{item['id']}"
+        canonical = json.dumps(item, ensure_ascii=False, sort_keys=True)
+        return "sha1:" + hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+    
+    def _load_index(self, source: Source, fp: Optional[Tuple[int, int]]) -> Optional[SourceIndex]:
+        """读取仍然有效的二级索引（内存优先，其次本地状态；先校验小的状态部分再读结构）"""
+        path = self._state_file("index", source)
+        index = self._indexes.get(path)
+        if index is None or not index.is_valid_for(source.index_fields, source.dot_path, fp):
+            status = self._load_state(self._state_file("index_status", source))
+            if not status or not status_is_valid(status, source.index_fields, source.dot_path, fp):
+                return None
+            structure = self._load_state(path)
+            index = SourceIndex.from_dicts(structure, status) if structure else None
+            if index is None:
+                return None
+        self._indexes[path] = index
+        return index
+    
+    def _store_index(self, source: Source, index: SourceIndex, structure: bool = False):
+        """保存二级索引：状态部分总是写入，结构部分只在（重新）构建后写入"""
+        path = self._state_file("index", source)
+        self._indexes[path] = index
+        if structure:
+            self._save_state(path, index.structure_to_dict())
+        self._save_state(self._state_file("index_status", source), index.status_to_dict())
+    
+    def _update_index_status(self, source: Source, old_fp: Optional[Tuple[int, int]],
+                             new_fp: Optional[Tuple[int, int]], removed: Iterable[Any] = (),
+                             added: Iterable[Any] = ()):
+        """引擎只改写了 pushed/租约标记时，同步索引状态（不读写索引结构）
+
+        索引在改写前已失效（或从未构建）时什么也不做，下次带条件的访问会重建。
+        """
+        index = self._indexes.get(self._state_file("index", source))
+        if index is not None and index.is_valid_for(source.index_fields, source.dot_path, old_fp):
+            index.unpushed.difference_update(removed)
+            index.unpushed.update(added)
+            index.fingerprint = list(new_fp) if new_fp else None
+            self._save_state(self._state_file("index_status", source), index.status_to_dict())
+            return
+        
+        status_path = self._state_file("index_status", source)
+        status = self._load_state(status_path)
+        if not status or not status_is_valid(status, source.index_fields, source.dot_path, old_fp):
+            return
+        unpushed = set(status["unpushed"])
+        unpushed.difference_update(removed)
+        unpushed.update(added)
+        status["unpushed"] = list(unpushed)
+        status["fingerprint"] = list(new_fp) if new_fp else None
+        self._save_state(status_path, status)
+    
+    def _collect_file_items(self, source: Source, json_path: Path, query: Optional[Query] = None,
+                            indexed: bool = False, lease: Optional[Lease] = None,
+                            digest: Optional[Digest] = None) -> Tuple[List[Dict], Optional[Tuple[int, int]]]:
+        """本地文件源：收集未推送项、标记并写回，返回 (未推送项, 处理后的文件指纹)
+
+        indexed 为真时使用并增量维护源的二级索引：带条件的刷新只检查索引命中的项，
+        索引确认无匹配时连文件都不用解析。无条件刷新不读取/构建索引，只同步其状态部分。
+        有命中时仍需解析并整体写回数据文件（JSON 无法按行原地改写），耗时随文件大小增长。
+        文件中仍有未结束的租约时返回的指纹为None：租约可能过期，文件不能视为已处理完。
+        """
+        with self._lock(json_path):
+            # 文件未变化且已确认无未推送项，跳过解析
+            fp = self.cache.fingerprint(json_path)
+            if self.cache.is_clean(json_path, source.dot_path, fp):
+                return [], fp
             
-            if not json_path.exists():
-                return f"[ERR] JSON not found: {source.file}"
+            index = self._load_index(source, fp) if indexed and query is not None else None
+            if index is not None and not index.lookup(query):
+                return [], fp
             
             # 读取JSON数据
             with open(json_path, "r", encoding="utf-8") as f:
@@ -116,42 +286,455 @@ class RefreshEngine:
             # 定位到目标路径
             target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
             
-            # 收集未推送项
-            unpushed_items, changed = self._collect_unpushed_items(target)
+            built = False
+            if indexed and query is not None and index is None:
+                index = SourceIndex.build(source.index_fields, source.dot_path, fp, self._iter_items(target))
+                built = True
             
-            if not unpushed_items:
-                return "No Any Update"
+            # 收集未推送项
+            locators = index.lookup(query) if index is not None else None
+            unpushed_items, marked, held = self._collect_unpushed_items(target, query, locators, lease, digest)
             
             # 写回文件
-            if changed:
+            old_fp = fp
+            if marked:
                 self._atomic_write(json_path, data)
+                fp = self.cache.fingerprint(json_path)
+                if lease is not None:
+                    self._track_lease(lease, source, json_path, indexed)
+            
+            # 只有pushed标记变化，索引增量更新即可（租约中的项提交后才移出未推送集合）
+            removed = marked if lease is None else ()
+            if built:
+                index.unpushed.difference_update(removed)
+                index.fingerprint = list(fp) if fp else None
+                self._store_index(source, index, structure=True)
+            elif indexed and marked:
+                self._update_index_status(source, old_fp, fp, removed=removed)
             
-            # 格式化输出
-            return self._format_items(unpushed_items, source.name_key)
+            if held or (lease is not None and marked):
+                return unpushed_items, None
+            
+            if query is None or (index is not None and not index.unpushed):
+                self.cache.mark_clean(json_path, source.dot_path, fp)
+        
+        return unpushed_items, fp
+    
+    def _glob_paths(self, source: Source) -> List[Path]:
+        """展开目录源匹配的文件（目录视为 <目录>/*.json）"""
+        pattern = source.file
+        if source.kind != "glob":
+            pattern = pattern.rstrip("/\\") + "/*.json"
+        
+        base_resolved = self.base_dir.resolve()
+        raw = Path(pattern).expanduser()
+        if raw.anchor:
+            root, rel = Path(raw.anchor), str(raw.relative_to(raw.anchor))
+        else:
+            root, rel = base_resolved, pattern
+        
+        state_dir = self.state_root.resolve()
+        paths = []
+        for p in root.glob(rel):
+            if not p.is_file() or p.suffix in (".tmp", ".lock") or SEGMENT_MARKER in p.name:
+                continue
+            resolved = p.resolve()
+            if state_dir in resolved.parents:
+                continue
+            if not raw.anchor:
+                # 与 _safe_join 一致：相对模式不允许逃逸出 base_dir
+                try:
+                    resolved.relative_to(base_resolved)
+                except ValueError:
+                    raise PermissionError(f"path escapes base dir: {resolved} not in {base_resolved}")
+            paths.append(resolved)
+        return sorted(paths)
+    
+    def _collect_glob_items(self, source: Source, query: Optional[Query] = None,
+                            lease: Optional[Lease] = None,
+                            digest: Optional[Digest] = None) -> Tuple[List[Dict], List[str]]:
+        """目录源：只处理清单中新增或变化的文件，并行收集后合并
+
+        返回 (未推送项, 失败的文件及原因)；失败的文件不记入清单，下次刷新重试。
+        """
+        if query is not None:
+            return self._collect_glob_items_filtered(source, query, lease, digest)
+        
+        manifest_path = self._state_file("manifest", source)
+        with self._lock(manifest_path):
+            manifest = self._load_state(manifest_path)
+            known = manifest.get("files", {}) if manifest.get("pattern") == source.file else {}
+            
+            paths = self._glob_paths(source)
+            files = {}
+            changed = []
+            for p in paths:
+                fp = self.cache.fingerprint(p)
+                if fp is None:
+                    continue
+                if known.get(str(p)) == list(fp):
+                    files[str(p)] = list(fp)
+                else:
+                    changed.append(p)
+            
+            results: List[Tuple[Path, Any]] = []
+            if changed:
+                def work(p: Path):
+                    try:
+                        return p, self._collect_file_items(source, p, lease=lease, digest=digest)
+                    except Exception as e:
+                        return p, e
+                
+                with ThreadPoolExecutor(max_workers=min(self.glob_workers, len(changed))) as pool:
+                    results = list(pool.map(work, changed))
+            
+            unpushed_items = []
+            errors = []
+            for p, result in results:
+                if isinstance(result, Exception):
+                    # 失败的文件不记入清单，下次重试
+                    log.error(f"Failed to refresh {p} for source {source.name_key}: {result}")
+                    errors.append(f"{p.name}: {result}")
+                    continue
+                items, fp = result
+                unpushed_items.extend(items)
+                if fp is not None:
+                    files[str(p)] = list(fp)
+            
+            self._save_state(manifest_path, {"pattern": source.file, "files": files})
+            collected = len(unpushed_items) if digest is None else digest.total
+            log.info(f"Glob source {source.name_key}: {len(paths)} files, {len(changed)} changed, "
+                     f"{collected} items, {len(errors)} failed")
+        
+        return unpushed_items, errors
+    
+    def _collect_glob_items_filtered(self, source: Source, query: Query,
+                                     lease: Optional[Lease] = None,
+                                     digest: Optional[Digest] = None) -> Tuple[List[Dict], List[str]]:
+        """目录源的条件刷新：逐个文件过滤，不更新清单，返回 (未推送项, 失败的文件及原因)
+
+        未命中的未推送项仍留在文件中；被改写的文件指纹变化，下次无条件刷新时会重新处理。
+        """
+        unpushed_items = []
+        errors = []
+        remaining = query.limit
+        for p in self._glob_paths(source):
+            if remaining is not None and remaining <= 0:
+                break
+            sub_query = Query(query.conditions, remaining)
+            before = digest.total if digest is not None else 0
+            try:
+                items, _ = self._collect_file_items(source, p, sub_query, lease=lease, digest=digest)
+            except Exception as e:
+                log.error(f"Failed to refresh {p} for source {source.name_key}: {e}")
+                errors.append(f"{p.name}: {e}")
+                continue
+            unpushed_items.extend(items)
+            if remaining is not None:
+                remaining -= len(items) if digest is None else digest.total - before
+        return unpushed_items, errors
+    
+    def _collect_http_items(self, source: Source, query: Optional[Query] = None,
+                            lease: Optional[Lease] = None,
+                            digest: Optional[Digest] = None) -> List[Dict]:
+        """远程源：条件请求拉取，投递状态记录在本地（远端不可写）
+
+        租约记录在状态的 leases 中（租约ID -> 到期时间与对象标识），提交后并入 delivered。
+        完整拉取且没有其他租约时，响应的 ETag/Last-Modified 随租约保存，全部租约提交后写回状态。
+        """
+        state_path = self._state_file("http", source)
+        with self._lock(state_path):
+            state = self._load_state(state_path)
+            if state.get("url") != source.url:
+                state = {}
+            
+            now = time.time()
+            leases = {lid: entry for lid, entry in state.get("leases", {}).items() if entry["expires"] > now}
+            
+            headers = {}
+            if state.get("etag"):
+                headers["If-None-Match"] = state["etag"]
+            if state.get("last_modified"):
+                headers["If-Modified-Since"] = state["last_modified"]
+            
+            resp = self.http.request("GET", source.url, headers)
+            if resp.status == 304:
+                return []
+            if resp.status != 200:
+                raise RuntimeError(f"HTTP {resp.status} from {source.url}")
+            
+            data = json.loads(resp.body)
+            target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
+            
+            # 只保留上游当前仍存在的对象标识，状态大小随上游而非历史增长
+            delivered = set(state.get("delivered", []))
+            held = {key for entry in leases.values() for key in entry["keys"]}
+            current = []
+            taken = []
+            unpushed_items = []
+            limit = query.limit if query else None
+            for _, item in self._iter_items(target):
+                key = self._item_key(item)
+                current.append(key)
+                if item.get("pushed", False) or key in delivered or key in held:
+                    continue
+                if query and not query.matches(item):
+                    continue
+                if limit is not None and len(taken) >= limit:
+                    continue
+                if digest is not None:
+                    digest.add(item)
+                else:
+                    unpushed_items.append(item)
+                taken.append(key)
+            
+            if state.get("reset") and self.dedup is not None and unpushed_items:
+                self.dedup.forget(unpushed_items)
+            
+            validators = {"etag": resp.headers.get("etag"), "last_modified": resp.headers.get("last-modified")}
+            if lease is None:
+                delivered.update(taken)
+            elif taken:
+                entry = {"expires": lease.expires, "keys": taken}
+                if query is None and not leases:
+                    # 本次拉取领取了上游当前全部未投递对象，提交后条件请求缓存才有效
+                    entry["validators"] = validators
+                leases[lease.id] = entry
+                self._track_lease(lease, source, None, False)
+            
+            new_state = {
+                "url": source.url,
+                "delivered": [key for key in current if key in delivered],
+            }
+            if leases:
+                new_state["leases"] = leases
+            if state.get("reset") and query is not None:
+                new_state["reset"] = True  # 条件刷新只投递了部分对象，保留标记到下次完整拉取
+            # 条件刷新未投递全部对象、或仍有租约可能过期退回时，不保存条件请求缓存，保证下次完整拉取
+            if query is None and not leases:
+                new_state.update(validators)
+            self._save_state(state_path, new_state)
+        
+        return unpushed_items
+    
+    def refresh_source(self, source: Source, query: Optional[Query] = None,
+                       lease: Optional[Lease] = None, seen: Optional[set] = None) -> str:
+        """刷新单个数据源（query 为可选的条件过滤）
+
+        lease 为空时立即标记为已推送；给出租约时只领取，由调用方在回复送达后 commit_lease。
+        transform 为 digest 的源回复按字段汇总的摘要，未推送项同样被标记（或领取）。
+        开启去重时丢弃重复项（照常标记），seen 为同一次回复中其他源已出现的指纹。
+        """
+        digest = None
+        if source.transform == "digest":
+            digest = Digest(source.digest_fields or source.index_fields, source.digest_top_k)
+        failed: List[str] = []  # 目录源中读取失败的文件
+        try:
+            if source.kind == "http":
+                unpushed_items = self._collect_http_items(source, query, lease, digest)
+            elif source.kind == "glob":
+                unpushed_items, failed = self._collect_glob_items(source, query, lease, digest)
+            else:
+                json_path = self._safe_join(source.file)
+                
+                if not json_path.exists():
+                    return f"[ERR] JSON not found: {source.file}"
+                
+                if json_path.is_dir():
+                    unpushed_items, failed = self._collect_glob_items(source, query, lease, digest)
+                else:
+                    unpushed_items, _ = self._collect_file_items(
+                        source, json_path, query, indexed=bool(source.index_fields),
+                        lease=lease, digest=digest
+                    )
+            
+            if digest is not None:
+                reply = digest.render(source.name_key, drill=source.kind != "http") if digest.total else "No Any Update"
+            elif not unpushed_items:
+                reply = "No Any Update"
+            elif self.dedup is not None:
+                texts, dropped = self.dedup.filter(unpushed_items, lease, seen)
+                reply = self._format_texts(texts)
+                if dropped:
+                    log.info(f"Dedup dropped {dropped}/{len(unpushed_items)} items from {source.name_key}")
+                    note = f"[去重] 丢弃 {dropped} 项重复"
+                    reply = f"{reply}\n{note}" if texts else note
+            else:
+                # 格式化输出
+                reply = self._format_items(unpushed_items, source.name_key)
+            
+            return self._note_failures(source, reply, "No Any Update", failed, "未包含在结果中（下次刷新重试）")
             
         except Exception as e:
             log.error(f"Failed to refresh source {source.name_key}: {e}")
             return f"[ERR] {source.name_key}: {e}"
     
-    def refresh_multiple_sources(self, sources: Dict[str, Source]) -> str:
-        """刷新多个数据源"""
+    def _note_failures(self, source: Source, reply: str, empty: str, failed: List[str], consequence: str) -> str:
+        """目录源部分文件失败时结果不完整，在回复中注明；没有其他结果（reply 为 empty）时只回复错误"""
+        if not failed:
+            return reply
+        shown = "; ".join(failed[:3]) + (f"; ...等{len(failed)}个" if len(failed) > 3 else "")
+        note = f"[ERR] {source.name_key}: {len(failed)} 个文件读取失败，{consequence}: {shown}"
+        return note if reply == empty else f"{reply}\n{note}"
+    
+    def _prioritize(self, sources: Dict[str, Source]) -> List[tuple[str, Source]]:
+        """刷新顺序：上次未完成的源 > 权重高 > 最近有更新"""
+        return sorted(
+            sources.items(),
+            key=lambda kv: (
+                kv[0] not in self._pending,
+                -kv[1].weight,
+                -self._last_activity.get(kv[0], 0.0),
+            )
+        )
+    
+    def refresh_multiple_sources(self, sources: Dict[str, Source], deadline: Optional[float] = None,
+                                 lease: Optional[Lease] = None) -> str:
+        """刷新多个数据源
+
+        deadline 为 time.monotonic() 时刻；到期后不再开始新的源，
+        已完成的结果照常返回，跳过的源保持未标记并在下次优先刷新。
+        """
         if not sources:
             return "No sources configured"
         
         results = []
-        for name_key, source in sources.items():
-            result = self.refresh_source(source)
+        skipped = []
+        started = 0
+        seen = set() if self.dedup is not None else None  # 本次回复中已出现的指纹
+        for name_key, source in self._prioritize(sources):
+            if deadline is not None and started:
+                # 剩余预算不足以完成该源（按历史耗时估计）时不再开始
+                expected = self._durations.get(name_key, 0.0)
+                if time.monotonic() + expected >= deadline:
+                    skipped.append(name_key)
+                    continue
+            
+            started += 1
+            t0 = time.monotonic()
+            result = self.refresh_source(source, lease=lease, seen=seen)
+            elapsed = time.monotonic() - t0
+            prev = self._durations.get(name_key)
+            self._durations[name_key] = elapsed if prev is None else 0.7 * prev + 0.3 * elapsed
+            self._pending.discard(name_key)
+            
             if result != "No Any Update":
                 if result.startswith("[ERR]"):
                     results.append(result)
                 else:
+                    self._last_activity[name_key] = time.time()
                     results.append(f"[{name_key}]\n{result}")
         
+        self._pending.update(skipped)
+        if skipped:
+            log.info(f"Refresh deadline reached, {len(skipped)} sources deferred: {skipped}")
+            results.append(
+                f"[部分结果] 时间预算已用完，{len(skipped)} 个源尚未刷新: {', '.join(skipped)}\n"
+                f"再次发送 /refresh 将继续处理这些源"
+            )
+        
         if not results:
             return "No Any Update"
         
         return "\n\n".join(results)
     
+    def begin_lease(self, ttl: float) -> Lease:
+        """创建租约：到期前未提交的项会被重新领取"""
+        return Lease.new(ttl)
+    
+    def _track_lease(self, lease: Lease, source: Source, path: Optional[Path], indexed: bool):
+        """记录租约领取过的文件（远程源 path 为None），供提交/释放时定位"""
+        with self._lease_lock:
+            targets = self._leased.setdefault(lease.id, [])
+            if not any(s.name_key == source.name_key and p == path for s, p, _ in targets):
+                targets.append((source, path, indexed))
+    
+    def commit_lease(self, lease: Lease) -> int:
+        """回复送达后提交：租约中的项标记为已推送，返回提交数量"""
+        return self._settle_lease(lease, commit=True)
+    
+    def release_lease(self, lease: Lease) -> int:
+        """回复失败时释放：租约中的项立即恢复为未推送，返回释放数量"""
+        return self._settle_lease(lease, commit=False)
+    
+    def _settle_lease(self, lease: Lease, commit: bool) -> int:
+        with self._lease_lock:
+            targets = self._leased.pop(lease.id, [])
+        
+        if self.dedup is not None:
+            try:
+                self.dedup.settle(lease, commit)
+            except Exception as e:
+                log.error(f"Failed to settle dedup fingerprints of lease {lease.id}: {e}")
+        
+        settled = 0
+        for source, path, indexed in targets:
+            try:
+                if path is None:
+                    settled += self._settle_http(source, lease, commit)
+                else:
+                    settled += self._settle_file(source, path, lease, commit, indexed)
+            except Exception as e:
+                # 未能结束的租约到期后自动失效
+                log.error(f"Failed to {'commit' if commit else 'release'} lease {lease.id} "
+                          f"for {source.name_key}: {e}")
+        
+        if settled:
+            log.info(f"Lease {lease.id} {'committed' if commit else 'released'}: {settled} items")
+        return settled
+    
+    def _settle_file(self, source: Source, json_path: Path, lease: Lease, commit: bool, indexed: bool) -> int:
+        """在单个文件中提交/释放租约"""
+        with self._lock(json_path):
+            fp = self.cache.fingerprint(json_path)
+            
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            
+            target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
+            
+            # 只处理仍属于本租约的项：已过期并被其他刷新重新领取的项不再属于本租约
+            now = int(time.time())
+            settled = []
+            for loc, item in self._iter_items(target):
+                mark = item.get(LEASE_FIELD)
+                if not isinstance(mark, dict) or mark.get("id") != lease.id:
+                    continue
+                del item[LEASE_FIELD]
+                if commit:
+                    item["pushed"] = True
+                    item["pushed_at"] = now
+                settled.append(loc)
+            
+            if settled:
+                self._atomic_write(json_path, data)
+                self.cache.invalidate(json_path)
+                if indexed:
+                    self._update_index_status(source, fp, self.cache.fingerprint(json_path),
+                                              removed=settled if commit else ())
+        
+        return len(settled)
+    
+    def _settle_http(self, source: Source, lease: Lease, commit: bool) -> int:
+        """在远程源的本地状态中提交/释放租约"""
+        state_path = self._state_file("http", source)
+        with self._lock(state_path):
+            state = self._load_state(state_path)
+            entry = state.get("leases", {}).pop(lease.id, None)
+            if entry is None:
+                return 0
+            if commit:
+                delivered = state.setdefault("delivered", [])
+                known = set(delivered)
+                delivered.extend(key for key in entry["keys"] if key not in known)
+            if not state.get("leases"):
+                state.pop("leases", None)
+                # 没有其他租约（包括过期未清理的）时，上游内容已全部投递，恢复条件请求缓存
+                if commit and entry.get("validators"):
+                    state.update(entry["validators"])
+            self._save_state(state_path, state)
+        return len(entry["keys"])
+    
     def _format_items(self, items: List[Dict], source_name: str = "") -> str:
         """格式化输出项目"""
         if not items:
@@ -164,13 +747,78 @@ class RefreshEngine:
         
         return text
     
-    def reset_source(self, source: Source) -> str:
-        """重置数据源（将pushed设置为false）"""
+    def _format_texts(self, texts: List[str]) -> str:
+        """由各项已序列化的 JSON 拼出与 _format_items 相同的输出（不再整体序列化）"""
+        if not texts:
+            return "No Any Update"
+        
+        # 与 json.dumps(items, indent=2) 相同：每项缩进一级（字符串中的换行已被转义）
+        text = "[\n" + ",\n".join("  " + t.replace("\n", "\n  ") for t in texts) + "\n]"
+        if len(text) > 4000:
+            text = text[:4000] + "\n...[truncated]"
+        
+        return text
+    
+    def reset_source(self, source: Source, query: Optional[Query] = None,
+                     include_archive: bool = False) -> str:
+        """重置数据源（将pushed设置为false）
+
+        query 为可选的条件过滤；include_archive 为真时同时把归档中匹配的项恢复到数据文件。
+        """
         try:
-            json_path = self._safe_join(source.file)
+            if source.kind == "http":
+                if query is not None or include_archive:
+                    return f"[ERR] {source.name_key}: 远程源不支持按条件或归档重置"
+                return self._reset_http_source(source)
             
-            if not json_path.exists():
-                return f"[ERR] JSON not found: {source.file}"
+            if source.kind == "glob":
+                reset_items = self._reset_glob_source(source, query)
+            else:
+                json_path = self._safe_join(source.file)
+                
+                if not json_path.exists():
+                    return f"[ERR] JSON not found: {source.file}"
+                
+                if json_path.is_dir():
+                    reset_items = self._reset_glob_source(source, query)
+                else:
+                    reset_items = self._reset_file(source, json_path, query, indexed=bool(source.index_fields))
+            
+            restored_items = []
+            if include_archive:
+                remaining = query.limit - len(reset_items) if query and query.limit else None
+                for p in self._local_paths(source):
+                    if remaining is not None and remaining <= 0:
+                        break
+                    items = self._restore_archived(source, p, query, remaining)
+                    restored_items.extend(items)
+                    if remaining is not None:
+                        remaining -= len(items)
+            
+            if self.dedup is not None and (reset_items or restored_items):
+                # 主动重置的项要重新投递，不能被去重窗口当作重复丢弃
+                self.dedup.forget(reset_items + restored_items)
+            
+            reset_count, restored = len(reset_items), len(restored_items)
+            if reset_count + restored > 0:
+                note = f" ({restored} restored from archive)" if restored else ""
+                return f"Reset {reset_count + restored} items in {source.name_key}{note}"
+            else:
+                return f"No items to reset in {source.name_key}"
+                
+        except Exception as e:
+            log.error(f"Failed to reset source {source.name_key}: {e}")
+            return f"[ERR] {source.name_key}: {e}"
+    
+    def _reset_file(self, source: Source, json_path: Path, query: Optional[Query] = None,
+                    indexed: bool = False) -> List[Dict]:
+        """重置单个文件中的pushed标记，返回被重置的项"""
+        with self._lock(json_path):
+            fp = self.cache.fingerprint(json_path)
+            index = self._load_index(source, fp) if indexed and query is not None else None
+            locators = index.lookup(query, pushed=True) if index is not None else None
+            if locators is not None and not locators:
+                return []
             
             with open(json_path, "r", encoding="utf-8") as f:
                 data = json.load(f)
@@ -178,37 +826,253 @@ class RefreshEngine:
             target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
             
             # 重置pushed标记
-            reset_count = self._reset_pushed_flags(target)
+            reset = self._reset_pushed_flags(target, query, locators)
             
-            if reset_count > 0:
+            if reset:
                 self._atomic_write(json_path, data)
-                return f"Reset {reset_count} items in {source.name_key}"
-            else:
-                return f"No items to reset in {source.name_key}"
-                
+                self.cache.invalidate(json_path)
+                if indexed:
+                    self._update_index_status(source, fp, self.cache.fingerprint(json_path), added=reset)
+        
+        return [self._item_at(target, loc) for loc in reset]
+    
+    def _local_paths(self, source: Source) -> List[Path]:
+        """本地源（file/glob）对应的数据文件"""
+        if source.kind == "glob":
+            return self._glob_paths(source)
+        json_path = self._safe_join(source.file)
+        if json_path.is_dir():
+            return self._glob_paths(source)
+        if not json_path.exists():
+            raise FileNotFoundError(f"JSON not found: {source.file}")
+        return [json_path]
+    
+    def compact_source(self, source: Source, retention_seconds: float) -> str:
+        """归档压缩：把推送时间早于保留期的已推送项移出数据文件，写入旁边的gzip归档段"""
+        try:
+            if source.kind == "http":
+                return f"No items to compact in {source.name_key}"
+            
+            cutoff = time.time() - retention_seconds
+            archived = 0
+            failed = []  # 目录源中无法压缩的文件，跳过
+            for p in self._local_paths(source):
+                try:
+                    archived += self._compact_file(source, p, cutoff)
+                except Exception as e:
+                    log.error(f"Failed to compact {p} for source {source.name_key}: {e}")
+                    failed.append(f"{p.name}: {e}")
+            
+            empty = f"No items to compact in {source.name_key}"
+            reply = f"Archived {archived} items in {source.name_key}" if archived else empty
+            return self._note_failures(source, reply, empty, failed, "未归档（下次压缩重试）")
         except Exception as e:
-            log.error(f"Failed to reset source {source.name_key}: {e}")
+            log.error(f"Failed to compact source {source.name_key}: {e}")
             return f"[ERR] {source.name_key}: {e}"
     
-    def _reset_pushed_flags(self, target: Any) -> int:
-        """重置pushed标记，返回重置数量"""
-        reset_count = 0
+    def _compact_file(self, source: Source, json_path: Path, cutoff: float) -> int:
+        """压缩单个文件，返回归档数量"""
+        with self._lock(json_path):
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            
+            target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
+            
+            now = int(time.time())
+            stamped = False
+            expired = []
+            for loc, item in self._iter_items(target):
+                if loc is None or not item.get("pushed", False):
+                    continue
+                pushed_at = item.get("pushed_at")
+                if not isinstance(pushed_at, (int, float)):
+                    # 早于本功能推送的项没有推送时间，从现在开始计算保留期
+                    item["pushed_at"] = now
+                    stamped = True
+                elif pushed_at <= cutoff:
+                    expired.append(loc)
+            
+            if isinstance(target, dict):
+                # 对象集合少于2项会被识别为单个对象，至少保留2项
+                expired = expired[:max(0, len(target) - 2)]
+            
+            if expired:
+                write_segment(new_segment_path(json_path), [
+                    {"loc": loc if isinstance(target, dict) else None,
+                     "dot_path": source.dot_path,
+                     "item": self._item_at(target, loc)}
+                    for loc in expired
+                ])
+                if isinstance(target, list):
+                    drop = set(expired)
+                    target[:] = [v for i, v in enumerate(target) if i not in drop]
+                else:
+                    for loc in expired:
+                        del target[loc]
+            
+            # 先写归档段再写数据文件：中途失败最多产生重复，不会丢失
+            if expired or stamped:
+                self._atomic_write(json_path, data)
+                self.cache.invalidate(json_path)
         
-        if isinstance(target, list):
-            for item in target:
-                if isinstance(item, dict) and item.get("pushed", False):
+        if expired:
+            log.info(f"Compacted {json_path}: {len(expired)} items archived")
+        return len(expired)
+    
+    def _restore_archived(self, source: Source, json_path: Path, query: Optional[Query],
+                          limit: Optional[int]) -> List[Dict]:
+        """把归档中匹配的项恢复为未推送状态，返回恢复的项"""
+        with self._lock(json_path):
+            segments = segment_paths(json_path)
+            if not segments:
+                return []
+            
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            
+            target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
+            
+            restored = []
+            rewrites = []
+            for seg in segments:
+                keep = []
+                changed = False
+                for record in read_segment(seg):
+                    item = record.get("item")
+                    loc = record.get("loc")
+                    usable = (
+                        record.get("dot_path") == source.dot_path
+                        and isinstance(item, dict)
+                        and (limit is None or len(restored) < limit)
+                        and (query is None or query.matches(item))
+                        and not (isinstance(target, dict) and loc in target)
+                    )
+                    if not usable:
+                        keep.append(record)
+                        continue
                     item["pushed"] = False
-                    reset_count += 1
-        elif isinstance(target, dict):
-            is_collection = any(isinstance(v, dict) for v in target.values()) and len(target) > 1
-            if is_collection:
-                for v in target.values():
-                    if isinstance(v, dict) and v.get("pushed", False):
-                        v["pushed"] = False
-                        reset_count += 1
+                    item.pop("pushed_at", None)
+                    if isinstance(target, list):
+                        target.append(item)
+                    else:
+                        target[loc] = item
+                    restored.append(item)
+                    changed = True
+                if changed:
+                    rewrites.append((seg, keep))
+            
+            # 先写数据文件再改写归档段：中途失败最多产生重复，不会丢失
+            if restored:
+                self._atomic_write(json_path, data)
+                self.cache.invalidate(json_path)
+                for seg, keep in rewrites:
+                    if keep:
+                        write_segment(seg, keep)
+                    else:
+                        seg.unlink()
+        
+        return restored
+    
+    def history(self, source: Source, query: Optional[Query] = None) -> str:
+        """查询已推送的历史项（数据文件中的已推送项 + 归档段），从新到旧"""
+        try:
+            if source.kind == "http":
+                return f"[ERR] {source.name_key}: 远程源没有本地历史"
+            
+            limit = query.limit if query and query.limit else 20
+            found = []
+            failed = []  # 目录源中无法读取的数据文件/归档段，跳过
+            for p in self._local_paths(source):
+                try:
+                    with self._lock(p):
+                        with open(p, "r", encoding="utf-8") as f:
+                            data = json.load(f)
+                    target = data if not source.dot_path else self._get_by_dot_path(data, source.dot_path)
+                    hot = [item for _, item in self._iter_items(target) if item.get("pushed", False)]
+                except Exception as e:
+                    log.error(f"Failed to read history of {p} for source {source.name_key}: {e}")
+                    failed.append(f"{p.name}: {e}")
+                    hot = []  # 数据文件损坏时归档段仍可查询
+                for item in reversed(hot):
+                    if len(found) >= limit:
+                        break
+                    if query is None or query.matches(item):
+                        found.append(item)
+                
+                for seg in segment_paths(p):
+                    if len(found) >= limit:
+                        break
+                    try:
+                        for record in read_segment(seg):
+                            item = record.get("item")
+                            if record.get("dot_path") != source.dot_path or not isinstance(item, dict):
+                                continue
+                            if query is None or query.matches(item):
+                                found.append(item)
+                                if len(found) >= limit:
+                                    break
+                    except Exception as e:
+                        log.error(f"Failed to read archive {seg} for source {source.name_key}: {e}")
+                        failed.append(f"{seg.name}: {e}")
+                if len(found) >= limit:
+                    break
+            
+            empty = f"No history in {source.name_key}"
+            reply = self._format_items(found, source.name_key) if found else empty
+            return self._note_failures(source, reply, empty, failed, "未包含在结果中")
+        except Exception as e:
+            log.error(f"Failed to query history of {source.name_key}: {e}")
+            return f"[ERR] {source.name_key}: {e}"
+    
+    def _reset_glob_source(self, source: Source, query: Optional[Query] = None) -> List[Dict]:
+        """重置目录源匹配的所有文件，并清空清单，返回被重置的项"""
+        manifest_path = self._state_file("manifest", source)
+        with self._lock(manifest_path):
+            reset_items = []
+            for p in self._glob_paths(source):
+                try:
+                    reset_items.extend(self._reset_file(source, p, query))
+                except Exception as e:
+                    log.error(f"Failed to reset {p} for source {source.name_key}: {e}")
+            manifest_path.unlink(missing_ok=True)
+        return reset_items
+    
+    def _reset_http_source(self, source: Source) -> str:
+        """重置远程源：清除本地投递记录与条件请求缓存
+
+        开启去重时留下 reset 标记：下次完整拉取时先从去重索引中移除重新投递的项。
+        """
+        state_path = self._state_file("http", source)
+        with self._lock(state_path):
+            reset_count = len(self._load_state(state_path).get("delivered", []))
+            if self.dedup is not None:
+                self._save_state(state_path, {"url": source.url, "reset": True})
             else:
-                if target.get("pushed", False):
-                    target["pushed"] = False
-                    reset_count += 1
+                state_path.unlink(missing_ok=True)
+        
+        if reset_count > 0:
+            return f"Reset {reset_count} items in {source.name_key}"
+        return f"No items to reset in {source.name_key}"
+    
+    def _reset_pushed_flags(self, target: Any, query: Optional[Query] = None,
+                            locators: Optional[List[Any]] = None) -> List[Any]:
+        """重置pushed标记，返回被重置项的定位符"""
+        if locators is None:
+            pairs = self._iter_items(target)
+        else:
+            pairs = ((loc, self._item_at(target, loc)) for loc in locators)
+        
+        reset = []
+        limit = query.limit if query else None
+        for loc, item in pairs:
+            if item is None or not item.get("pushed", False):
+                continue
+            if query and not query.matches(item):
+                continue
+            item["pushed"] = False
+            item.pop("pushed_at", None)
+            reset.append(loc)
+            if limit is not None and len(reset) >= limit:
+                break
         
-        return reset_count
\ No newline at end of file
+        return reset
\ No newline at end of file
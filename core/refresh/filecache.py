@@ -0,0 +1,95 @@
+# core/refresh/filecache.py
+import re
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from core.registry.snapshot import fingerprint
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台只做进程内互斥
+    fcntl = None
+
+class FileLock:
+    """文件锁：进程内可重入的线程锁 + 跨进程的 flock
+
+    flock 加在单独的锁文件上（数据文件本身会被原子替换，不能直接加锁），
+    只在最外层获取时加锁，因此同一线程可以重入。给出 lock_dir 时锁文件为
+    `<lock_dir>/<文件名>-<绝对路径哈希>.lock`，否则为文件旁的隐藏文件 `.<文件名>.lock`。
+    """
+
+    def __init__(self, path: Path, lock_dir: Optional[Path] = None):
+        self.path = path
+        if lock_dir is None:
+            self.lock_path = path.with_name(f".{path.name}.lock")
+        else:
+            name = re.sub(r"[^\w.-]", "_", path.name)[:64]
+            digest = hashlib.sha1(str(path.resolve()).encode("utf-8")).hexdigest()[:12]
+            self.lock_path = lock_dir / f"{name}-{digest}.lock"
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self) -> "FileLock":
+        self._rlock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+                fd = open(self.lock_path, "a+b")
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._fd = fd
+            except OSError:
+                # 锁文件不可写（如只读目录）时退化为进程内互斥
+                self._fd = None
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            self._fd.close()
+            self._fd = None
+        self._rlock.release()
+
+class FileCache:
+    """文件状态缓存：按解析后的绝对路径去重，可在多个引擎/租户之间共享
+
+    - 每个文件一把锁，保证对同一文件的读改写互斥（进程内与跨进程）
+    - 记录"已无未推送项"的文件指纹，文件未变化时刷新无需再解析JSON
+    """
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks: Dict[Path, FileLock] = {}
+        self._clean: Dict[Tuple[Path, Optional[str]], Tuple[int, int]] = {}
+
+    def lock(self, path: Path, lock_dir: Optional[Path] = None) -> FileLock:
+        """获取文件锁（锁文件放在 lock_dir 下，见 FileLock；同一文件以首次获取时为准）"""
+        with self._guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = FileLock(path, lock_dir)
+            return lock
+
+    def fingerprint(self, path: Path) -> Optional[Tuple[int, int]]:
+        """文件指纹 (mtime_ns, size)"""
+        return fingerprint(path)
+
+    def is_clean(self, path: Path, dot_path: Optional[str], fp: Optional[Tuple[int, int]]) -> bool:
+        """文件自上次确认以来未变化，且目标位置没有未推送项"""
+        return fp is not None and self._clean.get((path, dot_path)) == fp
+
+    def mark_clean(self, path: Path, dot_path: Optional[str], fp: Optional[Tuple[int, int]]):
+        """记录文件在指纹fp下已无未推送项"""
+        if fp is None:
+            self._clean.pop((path, dot_path), None)
+        else:
+            self._clean[(path, dot_path)] = fp
+
+    def invalidate(self, path: Path):
+        """丢弃文件的所有缓存状态"""
+        for key in list(self._clean):
+            if key[0] == path:
+                self._clean.pop(key, None)
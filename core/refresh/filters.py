@@ -0,0 +1,111 @@
+# core/refresh/filters.py
+"""
+聊天命令中的条件过滤，例如 `/refresh status severity=high limit=20`、`/reset status id>=100`。
+
+取值比较规则：两侧都能解析为数字时按数值比较，都不能时按字符串比较；
+只有一侧是数字时范围条件（> >= < <=）不匹配，与二级索引的范围查找一致。
+"""
+import math
+import operator
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+_CONDITION_RE = re.compile(r"^([^\s<>=!]+)(>=|<=|!=|=|>|<)(.+)$")
+
+_COMPARE = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+def numeric(v: Any) -> Optional[float]:
+    """取值的数值形式，无法解析时返回None"""
+    if isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v) if math.isfinite(v) else None
+    if isinstance(v, str):
+        try:
+            n = float(v)
+        except ValueError:
+            return None
+        return n if math.isfinite(n) else None
+    return None
+
+def index_key(v: Any) -> str:
+    """等值比较/索引使用的规范化取值：100、100.0、"100" 视为相同"""
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    n = numeric(v)
+    if n is not None:
+        return str(int(n)) if n.is_integer() else repr(n)
+    return str(v)
+
+@dataclass
+class Condition:
+    """单个过滤条件：字段 运算符 取值"""
+    field: str
+    op: str
+    value: str
+
+    @property
+    def number(self) -> Optional[float]:
+        return numeric(self.value)
+
+    @property
+    def key(self) -> str:
+        return index_key(self.value)
+
+    def matches(self, item: Dict) -> bool:
+        if self.field not in item:
+            return self.op == "!="
+        v = item[self.field]
+        if self.op in ("=", "!="):
+            equal = index_key(v) == self.key
+            return equal if self.op == "=" else not equal
+
+        a, b = numeric(v), self.number
+        if a is None and b is None:
+            a, b = index_key(v), self.value
+        elif a is None or b is None:
+            return False  # 数字与非数字不可比较（索引的范围表中只有数值）
+        return _COMPARE[self.op](a, b)
+
+    def __str__(self) -> str:
+        return f"{self.field}{self.op}{self.value}"
+
+@dataclass
+class Query:
+    """一组AND条件与可选的数量上限"""
+    conditions: List[Condition] = field(default_factory=list)
+    limit: Optional[int] = None
+
+    def matches(self, item: Dict) -> bool:
+        return all(c.matches(item) for c in self.conditions)
+
+    def __str__(self) -> str:
+        parts = [str(c) for c in self.conditions]
+        if self.limit is not None:
+            parts.append(f"limit={self.limit}")
+        return " ".join(parts)
+
+def parse_query(tokens: List[str]) -> Query:
+    """解析命令参数为查询，格式错误时抛出ValueError"""
+    query = Query()
+    for token in tokens:
+        if token.startswith("limit="):
+            try:
+                query.limit = int(token[len("limit="):])
+            except ValueError:
+                raise ValueError(f"limit 必须是整数: {token}")
+            if query.limit <= 0:
+                raise ValueError(f"limit 必须大于0: {token}")
+            continue
+
+        m = _CONDITION_RE.match(token)
+        if not m:
+            raise ValueError(f"无法解析条件: {token}（示例: severity=high id>=100 limit=20）")
+        query.conditions.append(Condition(m.group(1), m.group(2), m.group(3)))
+    return query
@@ -0,0 +1,112 @@
+# core/refresh/http_source.py
+import gzip
+import threading
+import http.client
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+log = logging.getLogger(__name__)
+
+# 复用空闲连接时对端可能已关闭，这些异常允许换新连接重试一次
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine,
+                 ConnectionResetError, BrokenPipeError)
+
+@dataclass
+class HttpResponse:
+    """HTTP响应（头部名称统一为小写）"""
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+class HttpConnectionPool:
+    """HTTP keep-alive 连接池：按 (scheme, host, port) 复用连接，并限制每个主机的并发数"""
+
+    def __init__(self, max_per_host: int = 4, timeout: float = 10.0):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._slots: Dict[Tuple[str, str, int], threading.BoundedSemaphore] = {}
+
+    def _slot(self, key: Tuple[str, str, int]) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._slots.get(key)
+            if sem is None:
+                sem = self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return sem
+
+    def _new_connection(self, key: Tuple[str, str, int]) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def _checkout(self, key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+        """取出空闲连接；返回 (连接, 是否为复用连接)"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(key), False
+
+    def _checkin(self, key: Tuple[str, str, int], conn: http.client.HTTPConnection):
+        with self._lock:
+            self._idle.setdefault(key, []).append(conn)
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None) -> HttpResponse:
+        """发送请求并读取完整响应体"""
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"unsupported url: {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        req_headers = {"Accept": "application/json", "Accept-Encoding": "gzip"}
+        req_headers.update(headers or {})
+
+        sem = self._slot(key)
+        if not sem.acquire(timeout=self.timeout):
+            raise TimeoutError(f"too many concurrent requests to {parts.hostname}:{port}")
+        try:
+            conn, reused = self._checkout(key)
+            try:
+                try:
+                    resp = self._send(conn, method, path, req_headers)
+                except _STALE_ERRORS:
+                    if not reused:
+                        raise
+                    conn.close()
+                    conn = self._new_connection(key)
+                    resp = self._send(conn, method, path, req_headers)
+                body = resp.read()
+            except Exception:
+                conn.close()
+                raise
+
+            if resp.will_close:
+                conn.close()
+            else:
+                self._checkin(key, conn)
+
+            resp_headers = {k.lower(): v for k, v in resp.getheaders()}
+            if resp_headers.get("content-encoding") == "gzip":
+                body = gzip.decompress(body)
+            return HttpResponse(resp.status, resp_headers, body)
+        finally:
+            sem.release()
+
+    def _send(self, conn: http.client.HTTPConnection, method: str, path: str,
+              headers: Dict[str, str]) -> http.client.HTTPResponse:
+        conn.request(method, path, headers=headers)
+        return conn.getresponse()
+
+    def close(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
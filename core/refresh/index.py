@@ -0,0 +1,162 @@
+# core/refresh/index.py
+import bisect
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from core.refresh.filters import Condition, Query, index_key, numeric
+
+class SourceIndex:
+    """单个JSON目标上的二级索引，按文件指纹失效
+
+    - eq:       字段 -> 规范化取值 -> 定位符列表（等值查询）
+    - ranges:   字段 -> (有序数值列表, 对应定位符列表)（范围查询）
+    - unpushed: 未推送项的定位符；引擎自身改写pushed时增量维护，无需重建
+
+    分两部分持久化：结构（order/eq/ranges，只随字段取值变化，仅在构建时写入）
+    与状态（文件指纹与 unpushed，引擎改写 pushed 后只重写这一小部分）；
+    两部分以构建时的文件指纹 built_for 对应。
+    """
+
+    def __init__(self, fields: List[str], dot_path: Optional[str], fingerprint: Optional[List[int]],
+                 order: List[Any], eq: Dict[str, Dict[str, List[Any]]],
+                 ranges: Dict[str, Tuple[List[float], List[Any]]], unpushed: Iterable[Any],
+                 built_for: Optional[List[int]] = None):
+        self.fields = fields
+        self.dot_path = dot_path
+        self.fingerprint = fingerprint
+        self.built_for = built_for if built_for is not None else fingerprint
+        self.order = order
+        self.eq = eq
+        self.ranges = ranges
+        self.unpushed: Set[Any] = set(unpushed)
+        self._pos = {loc: i for i, loc in enumerate(order)}
+
+    @classmethod
+    def build(cls, fields: List[str], dot_path: Optional[str], fingerprint: Optional[Tuple[int, int]],
+              items: Iterable[Tuple[Any, Dict]]) -> "SourceIndex":
+        """一次遍历构建索引"""
+        order = []
+        unpushed = []
+        eq: Dict[str, Dict[str, List[Any]]] = {f: {} for f in fields}
+        pairs: Dict[str, List[Tuple[float, int, Any]]] = {f: [] for f in fields}
+        for loc, item in items:
+            pos = len(order)
+            order.append(loc)
+            if not item.get("pushed", False):
+                unpushed.append(loc)
+            for f in fields:
+                v = item.get(f)
+                if v is None or isinstance(v, (dict, list)):
+                    continue
+                eq[f].setdefault(index_key(v), []).append(loc)
+                n = numeric(v)
+                if n is not None:
+                    pairs[f].append((n, pos, loc))
+
+        ranges = {}
+        for f, lst in pairs.items():
+            lst.sort(key=lambda t: (t[0], t[1]))
+            ranges[f] = ([t[0] for t in lst], [t[2] for t in lst])
+        return cls(list(fields), dot_path, list(fingerprint) if fingerprint else None,
+                   order, eq, ranges, unpushed)
+
+    def is_valid_for(self, fields: List[str], dot_path: Optional[str],
+                     fingerprint: Optional[Tuple[int, int]]) -> bool:
+        """索引是否仍对应当前文件与配置"""
+        return status_is_valid(
+            {"fields": self.fields, "dot_path": self.dot_path, "fingerprint": self.fingerprint},
+            fields, dot_path, fingerprint
+        )
+
+    def _field_candidates(self, field: str, conds: List[Condition]) -> Optional[List[Any]]:
+        """同一字段上的条件命中的定位符；无法用索引回答时返回None
+
+        等值条件取最小的命中列表；同一字段的多个范围条件合并为一次二分区间。
+        """
+        eqs = [self.eq[field].get(c.key, []) for c in conds if c.op == "="]
+        if eqs:
+            return min(eqs, key=len)
+
+        values, locs = self.ranges[field]
+        lo, hi = 0, len(values)
+        bounded = False
+        for c in conds:
+            n = c.number
+            if c.op not in (">", ">=", "<", "<=") or n is None:
+                continue
+            bounded = True
+            if c.op == ">":
+                lo = max(lo, bisect.bisect_right(values, n))
+            elif c.op == ">=":
+                lo = max(lo, bisect.bisect_left(values, n))
+            elif c.op == "<":
+                hi = min(hi, bisect.bisect_left(values, n))
+            else:
+                hi = min(hi, bisect.bisect_right(values, n))
+        return locs[lo:hi] if bounded else None
+
+    def lookup(self, query: Query, pushed: bool = False) -> List[Any]:
+        """按文档顺序返回候选定位符
+
+        候选只按pushed状态与索引字段上的条件预筛，调用方仍需逐项校验全部条件。
+        """
+        by_field: Dict[str, List[Condition]] = {}
+        for cond in query.conditions:
+            if cond.field in self.eq:
+                by_field.setdefault(cond.field, []).append(cond)
+
+        lists = [self._field_candidates(f, conds) for f, conds in by_field.items()]
+        lists = sorted((lst for lst in lists if lst is not None), key=len)
+
+        if lists:
+            best = lists[0]
+            # 其他字段的命中集不太大时再求交集，否则留给逐项校验
+            for other in lists[1:]:
+                if len(other) > 8 * len(best):
+                    break
+                other_set = set(other)
+                best = [loc for loc in best if loc in other_set]
+        elif not pushed:
+            best = self.unpushed
+        else:
+            best = self.order
+
+        if pushed:
+            cand = [loc for loc in best if loc not in self.unpushed and loc in self._pos]
+        else:
+            cand = [loc for loc in best if loc in self.unpushed]
+        cand.sort(key=self._pos.__getitem__)
+        return cand
+
+    def structure_to_dict(self) -> Dict:
+        return {
+            "built_for": self.built_for,
+            "order": self.order,
+            "eq": self.eq,
+            "ranges": {f: [values, locs] for f, (values, locs) in self.ranges.items()},
+        }
+
+    def status_to_dict(self) -> Dict:
+        return {
+            "fields": self.fields,
+            "dot_path": self.dot_path,
+            "built_for": self.built_for,
+            "fingerprint": self.fingerprint,
+            "unpushed": [loc for loc in self.order if loc in self.unpushed],
+        }
+
+    @classmethod
+    def from_dicts(cls, structure: Dict, status: Dict) -> Optional["SourceIndex"]:
+        """由结构与状态组装索引；两者不是同一次构建的产物时返回None"""
+        if structure.get("built_for") != status.get("built_for"):
+            return None
+        return cls(
+            status["fields"], status.get("dot_path"), status.get("fingerprint"),
+            structure["order"], structure["eq"],
+            {f: (values, locs) for f, (values, locs) in structure["ranges"].items()},
+            status["unpushed"], structure["built_for"]
+        )
+
+def status_is_valid(status: Dict, fields: List[str], dot_path: Optional[str],
+                    fingerprint: Optional[Tuple[int, int]]) -> bool:
+    """索引状态是否仍对应当前文件与配置"""
+    return (fingerprint is not None and status.get("fingerprint") == list(fingerprint)
+            and status.get("fields") == list(fields) and status.get("dot_path") == dot_path)
@@ -0,0 +1,37 @@
+# core/refresh/lease.py
+"""
+两阶段投递的租约
+
+刷新时给未推送项写入 `_lease: {"id": 租约ID, "expires": 到期时间}`，
+回复成功送达后提交（改为 pushed），失败时释放；未提交的租约到期后自动失效，
+这些项会被下一次刷新重新领取。
+"""
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+LEASE_FIELD = "_lease"
+
+@dataclass(frozen=True)
+class Lease:
+    """一次刷新持有的租约"""
+    id: str
+    expires: float
+
+    @classmethod
+    def new(cls, ttl: float) -> "Lease":
+        return cls(uuid.uuid4().hex, time.time() + ttl)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"id": self.id, "expires": self.expires}
+
+def active_lease_id(item: Dict, now: Optional[float] = None) -> Optional[str]:
+    """对象上仍有效的租约ID；没有租约或已过期返回None"""
+    mark = item.get(LEASE_FIELD)
+    if not isinstance(mark, dict):
+        return None
+    expires = mark.get("expires")
+    if not isinstance(expires, (int, float)) or expires <= (now if now is not None else time.time()):
+        return None
+    return mark.get("id")
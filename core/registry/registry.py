@@ -1,27 +1,54 @@
 # core/registry/registry.py
 import json
+import fnmatch
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 from core.model.source import Source
+from core.registry.snapshot import fingerprint, load_snapshot, write_snapshot
+from core.refresh.filecache import FileLock
 import logging
 
 log = logging.getLogger(__name__)
 
 class SourceRegistry:
-    """数据源注册表管理"""
+    """数据源注册表管理
+
+    单个修改立即写回注册表文件；在 batch() 中的修改共用一把锁，退出时只写一次。
+    修改持有注册表文件的跨进程锁，并先重新加载其他进程（如 manage_bot）写入的内容，
+    读改写在进程之间也是原子的。
+    """
     
     def __init__(self, registry_file: Path):
         self.registry_file = registry_file
         self._sources: Dict[str, Source] = {}
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(registry_file)
+        self._loaded = None  # 内存内容对应的注册表文件指纹
+        self._batch_depth = 0
+        self._dirty = False
         self._load_sources()
     
     def _load_sources(self):
         """从注册表文件加载数据源"""
+        self._sources = {}
+        self._loaded = fingerprint(self.registry_file)
         if not self.registry_file.exists():
             self.registry_file.parent.mkdir(parents=True, exist_ok=True)
             self._save_sources()
             return
         
+        # 快照命中：内容已校验过，跳过pydantic校验
+        cached = load_snapshot(self.registry_file, list(Source.model_fields))
+        if cached is not None:
+            self._sources = {
+                name_key: Source.model_construct(**source_data)
+                for name_key, source_data in cached.items()
+            }
+            log.info(f"Loaded {len(self._sources)} sources from registry snapshot")
+            return
+        
         try:
             with open(self.registry_file, "r", encoding="utf-8") as f:
                 data = json.load(f)
@@ -35,17 +62,54 @@ class SourceRegistry:
         except Exception as e:
             log.error(f"Failed to load registry: {e}")
             self._sources = {}
+            return
+        
+        self._write_snapshot()
+    
+    def _write_snapshot(self):
+        """写入已校验的注册表快照"""
+        write_snapshot(
+            self.registry_file,
+            list(Source.model_fields),
+            {name_key: source.model_dump() for name_key, source in self._sources.items()}
+        )
+    
+    @contextmanager
+    def batch(self) -> Iterator["SourceRegistry"]:
+        """批量修改：持有锁直到退出，期间的修改在退出时一次性原子写入
+
+        块内抛出异常时回滚本批修改，注册表文件保持不变。可以嵌套，由最外层负责写入。
+        """
+        with self._lock, self._file_lock:
+            outermost = self._batch_depth == 0
+            if outermost and fingerprint(self.registry_file) != self._loaded:
+                # 其他进程改写过注册表：在其基础上修改，避免覆盖
+                self._load_sources()
+            backup = dict(self._sources) if outermost else None
+            self._batch_depth += 1
+            try:
+                yield self
+            except BaseException:
+                if outermost:
+                    self._sources = backup
+                    self._dirty = False
+                raise
+            finally:
+                self._batch_depth -= 1
+            
+            if outermost and self._dirty:
+                self._dirty = False
+                self._save_sources()
     
     def _save_sources(self):
-        """保存数据源到注册表文件"""
+        """保存数据源到注册表文件（批量修改中推迟到批次结束）"""
+        if self._batch_depth:
+            self._dirty = True
+            return
+        
         data = {
             "items": {
-                name_key: {
-                    "file": source.file,
-                    "dot_path": source.dot_path,
-                    "enabled": source.enabled,
-                    "transform": source.transform
-                }
+                name_key: source.model_dump(exclude={"name_key"})
                 for name_key, source in self._sources.items()
             }
         }
@@ -55,18 +119,31 @@ class SourceRegistry:
         with open(tmp_file, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
         tmp_file.replace(self.registry_file)
+        self._loaded = fingerprint(self.registry_file)
+        self._write_snapshot()
     
-    def register_source(self, name_key: str, file_path: str, dot_path: Optional[str] = None) -> bool:
-        """注册新的数据源"""
+    def register_source(self, name_key: str, file_path: Optional[str], dot_path: Optional[str] = None,
+                        weight: float = 0.0, url: Optional[str] = None,
+                        index_fields: Optional[List[str]] = None, enabled: bool = True,
+                        transform: Optional[str] = None, digest_fields: Optional[List[str]] = None) -> bool:
+        """注册新的数据源（给出url时注册为http远程源）"""
         try:
             source = Source(
                 name_key=name_key,
                 file=file_path,
-                dot_path=dot_path
+                dot_path=dot_path,
+                enabled=enabled,
+                weight=weight,
+                kind="http" if url else "file",
+                url=url,
+                index_fields=index_fields or [],
+                transform=transform,
+                digest_fields=digest_fields or []
             )
-            self._sources[name_key] = source
-            self._save_sources()
-            log.info(f"Registered source: {name_key} -> {file_path}")
+            with self.batch():
+                self._sources[name_key] = source
+                self._save_sources()
+            log.info(f"Registered source: {name_key} -> {source.location}")
             return True
         except Exception as e:
             log.error(f"Failed to register source {name_key}: {e}")
@@ -74,12 +151,13 @@ class SourceRegistry:
     
     def remove_source(self, name_key: str) -> bool:
         """移除数据源"""
-        if name_key in self._sources:
+        with self.batch():
+            if name_key not in self._sources:
+                return False
             del self._sources[name_key]
             self._save_sources()
-            log.info(f"Removed source: {name_key}")
-            return True
-        return False
+        log.info(f"Removed source: {name_key}")
+        return True
     
     def get_source(self, name_key: str) -> Optional[Source]:
         """获取指定数据源"""
@@ -95,8 +173,26 @@ class SourceRegistry:
     
     def enable_source(self, name_key: str, enabled: bool = True) -> bool:
         """启用/禁用数据源"""
-        if name_key in self._sources:
-            self._sources[name_key].enabled = enabled
+        with self.batch():
+            source = self._sources.get(name_key)
+            if source is None:
+                return False
+            # 替换而非原地修改，批量回滚时旧对象保持原状
+            self._sources[name_key] = source.model_copy(update={"enabled": enabled})
             self._save_sources()
             return True
-        return False
\ No newline at end of file
+    
+    def match_sources(self, pattern: str) -> List[str]:
+        """按通配模式匹配数据源名称（如 "team-*"）"""
+        return [name_key for name_key in self._sources if fnmatch.fnmatchcase(name_key, pattern)]
+    
+    def enable_matching(self, patterns: List[str], enabled: bool = True) -> List[str]:
+        """批量启用/禁用匹配任一模式的数据源，一次写入；返回状态发生变化的名称"""
+        changed = []
+        with self.batch():
+            for pattern in patterns:
+                for name_key in self.match_sources(pattern):
+                    if self._sources[name_key].enabled != enabled:
+                        self.enable_source(name_key, enabled)
+                        changed.append(name_key)
+        return changed
\ No newline at end of file
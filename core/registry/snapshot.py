@@ -0,0 +1,70 @@
+# core/registry/snapshot.py
+"""
+注册表快照：缓存已校验的注册表内容，按文件指纹（mtime_ns + size）失效。
+
+本模块刻意不依赖 pydantic，CLI 的只读命令可以直接读取快照而无需导入模型层。
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".snapshot"
+
+
+def snapshot_path(registry_file: Path) -> Path:
+    """注册表文件对应的快照路径"""
+    return registry_file.with_name(registry_file.name + SNAPSHOT_SUFFIX)
+
+
+def fingerprint(path: Path) -> Optional[Tuple[int, int]]:
+    """文件指纹：(mtime_ns, size)，文件不存在时返回None"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def load_snapshot(registry_file: Path, schema: Optional[Sequence[str]] = None) -> Optional[Dict[str, dict]]:
+    """读取快照；指纹或模型字段不匹配时返回None"""
+    fp = fingerprint(registry_file)
+    if fp is None:
+        return None
+
+    try:
+        with open(snapshot_path(registry_file), "r", encoding="utf-8") as f:
+            snap = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if snap.get("fingerprint") != list(fp):
+        return None
+    if schema is not None and snap.get("schema") != sorted(schema):
+        return None
+
+    items = snap.get("items")
+    return items if isinstance(items, dict) else None
+
+
+def write_snapshot(registry_file: Path, schema: Sequence[str], items: Dict[str, dict]):
+    """写入快照（失败只记录日志，不影响注册表本身）"""
+    fp = fingerprint(registry_file)
+    if fp is None:
+        return
+
+    snap = {
+        "fingerprint": list(fp),
+        "schema": sorted(schema),
+        "items": items,
+    }
+    path = snapshot_path(registry_file)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snap, f, ensure_ascii=False)
+        tmp.replace(path)
+    except OSError as e:
+        log.warning(f"Failed to write registry snapshot {path}: {e}")
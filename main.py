@@ -1,12 +1,9 @@
 # app/main.py
 import logging
-from pathlib import Path
 from flask import Flask
 from app.web.routes import create_webhook_blueprint
-from app.web.handlers import WebhookHandler
-from app.adapters.wecom.crypto import WeChatCryptoAdapter
-from core.registry.registry import SourceRegistry
-from core.refresh.engine import RefreshEngine
+from app.tenants import TenantPool
+from app.compaction import CompactionScheduler
 from config.settings import Settings
 
 # 配置日志
@@ -23,23 +20,21 @@ def create_app() -> Flask:
     # 验证配置
     settings.validate()
     
-    # 初始化组件
-    crypto_adapter = WeChatCryptoAdapter(
+    # 初始化组件（默认应用与各租户共享加解密器池、注册表与文件缓存）
+    pool = TenantPool(settings)
+    handler = pool.build_handler(
         token=settings.token,
         aes_key=settings.aes_key,
-        corp_id=settings.corp_id
+        corp_id=settings.corp_id,
+        registry_file=settings.bot_registry_file,
+        base_dir=settings.json_base_dir,
+        agent_id=settings.agent_id
     )
-    
-    registry_file = Path(settings.bot_registry_file)
-    registry = SourceRegistry(registry_file)
-    
-    refresh_engine = RefreshEngine(settings.json_base_dir)
-    
-    # 初始化处理器
-    handler = WebhookHandler(crypto_adapter, registry, refresh_engine)
+    registry = handler.registry
+    tenants = pool.load_tenants()
     
     # 注册路由
-    app.register_blueprint(create_webhook_blueprint(handler))
+    app.register_blueprint(create_webhook_blueprint(handler, tenants))
     
     # 添加默认数据源（兼容旧版本）
     if not registry.list_sources():
@@ -50,6 +45,16 @@ def create_app() -> Flask:
         )
         log.info("Registered default source")
     
+    # 定时归档已推送项
+    if settings.compaction_retention_days is not None and settings.compaction_interval_seconds > 0:
+        scheduler = CompactionScheduler(
+            [(h.registry, h.engine) for h in [handler, *tenants.values()]],
+            retention_seconds=settings.compaction_retention_days * 86400,
+            interval_seconds=settings.compaction_interval_seconds
+        )
+        scheduler.start()
+        app.extensions["compaction"] = scheduler
+    
     log.info("Application initialized successfully")
     return app
 
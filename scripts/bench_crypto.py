@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# scripts/bench_crypto.py
+"""
+回调加解密快速路径：与 wechatpy 逐字节比对，并测量单核每秒处理的消息数
+
+    python scripts/bench_crypto.py [--n 5000] [--size 200]
+
+一条消息的处理 = 解密信封 + 解析消息 + 生成文本回复 + 加密回复，
+与 WebhookHandler.handle_message 中的调用顺序一致。
+"""
+import sys
+import time
+import random
+import string
+import argparse
+from pathlib import Path
+from unittest import mock
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from wechatpy.enterprise.crypto import PrpCrypto
+from app.adapters.wecom.crypto import WeChatCryptoAdapter
+from app.adapters.wecom.fastpath import FastCrypto
+
+TOKEN = "bench-token"
+AES_KEY = "abcdefghijklmnopqrstuvwxyz0123456789ABCDEFG"
+CORP_ID = "ww0123456789abcdef"
+FIXED_PREFIX = "0123456789abcdef"
+FIXED_TIME = 1700000000.0
+
+def _message(content: str, msg_type: str = "text", agent: bool = True) -> str:
+    """构造企业微信回调消息明文"""
+    parts = [
+        "<xml>",
+        f"<ToUserName><![CDATA[{CORP_ID}]]></ToUserName>",
+        "<FromUserName><![CDATA[zhangsan]]></FromUserName>",
+        "<CreateTime>1348831860</CreateTime>",
+        f"<MsgType><![CDATA[{msg_type}]]></MsgType>",
+    ]
+    if msg_type == "event":
+        parts.append("<Event><![CDATA[enter_agent]]></Event>")
+    else:
+        parts.append(f"<Content><![CDATA[{content}]]></Content>")
+        parts.append("<MsgId>1234567890123456</MsgId>")
+    if agent:
+        parts.append("<AgentID>1000002</AgentID>")
+    parts.append("</xml>")
+    return "".join(parts)
+
+def _corpus():
+    """比对用的消息集合：命令、中文、长文本、特殊字符、事件、缺少AgentID"""
+    rng = random.Random(42)
+    yield _message("/refresh")
+    yield _message("/refresh status severity=high limit=20")
+    yield _message("刷新所有数据源 🚀")
+    yield _message("a & b <c> \"d\" 'e'")
+    yield _message("x" * 5000)
+    yield _message("", agent=False)
+    yield _message("", msg_type="event")
+    for _ in range(200):
+        n = rng.randint(0, 300)
+        yield _message("".join(rng.choice(string.printable[:-5] + "数据源刷新") for _ in range(n)))
+
+def _envelope(plain: str, nonce: str, timestamp: str) -> str:
+    return FastCrypto(TOKEN, AES_KEY, CORP_ID).encrypt_message(plain, nonce, timestamp)
+
+def _roundtrip(adapter: WeChatCryptoAdapter, body: str, sig: str, timestamp: str, nonce: str) -> str:
+    msg = adapter.decrypt_message(body, sig, timestamp, nonce)
+    reply = adapter.create_text_reply(f"收到: {msg.content}", msg)
+    return adapter.encrypt_reply(reply, nonce, timestamp)
+
+def _signature_of(envelope: str) -> str:
+    start = envelope.index("<MsgSignature><![CDATA[") + len("<MsgSignature><![CDATA[")
+    return envelope[start:envelope.index("]]>", start)]
+
+def verify() -> int:
+    """逐字节比对快速路径与 wechatpy，返回不一致的数量"""
+    fast = WeChatCryptoAdapter(TOKEN, AES_KEY, CORP_ID, fast=True)
+    slow = WeChatCryptoAdapter(TOKEN, AES_KEY, CORP_ID, fast=False)
+    fields = ("type", "content", "source", "target", "agent", "id", "time")
+
+    mismatches = 0
+    total = 0
+    with mock.patch.object(PrpCrypto, "get_random_string", lambda self: FIXED_PREFIX), \
+         mock.patch.object(FastCrypto, "_random_prefix", lambda self: FIXED_PREFIX.encode()), \
+         mock.patch("time.time", return_value=FIXED_TIME):
+        for i, plain in enumerate(_corpus()):
+            total += 1
+            nonce, timestamp = f"nonce{i}", str(1700000000 + i)
+            body = _envelope(plain, nonce, timestamp)
+            sig = _signature_of(body)
+
+            # 信封解密结果一致（且 wechatpy 能解开快速路径生成的信封）
+            if fast.crypto.decrypt_message(body, sig, timestamp, nonce) != \
+                    slow.crypto.decrypt_message(body, sig, timestamp, nonce):
+                print(f"✗ #{i} decrypt differs")
+                mismatches += 1
+                continue
+
+            # 解析出的字段一致
+            fm = fast.decrypt_message(body, sig, timestamp, nonce)
+            sm = slow.decrypt_message(body, sig, timestamp, nonce)
+            diff = [f for f in fields if getattr(fm, f, None) != getattr(sm, f, None)]
+            if fm.type == "event":
+                diff = [f for f in diff if f != "content"]
+            if diff:
+                print(f"✗ #{i} parsed fields differ: {diff}")
+                mismatches += 1
+                continue
+
+            # 回复明文与加密后的信封逐字节一致
+            fr = fast.create_text_reply(f"收到: {getattr(fm, 'content', None)}", fm)
+            sr = slow.create_text_reply(f"收到: {getattr(sm, 'content', None)}", sm)
+            if fr.render() != sr.render():
+                print(f"✗ #{i} reply xml differs")
+                mismatches += 1
+                continue
+            if fast.encrypt_reply(fr, nonce, timestamp).encode("utf-8") != \
+                    slow.encrypt_reply(sr, nonce, timestamp).encode("utf-8"):
+                print(f"✗ #{i} encrypted envelope differs")
+                mismatches += 1
+
+    print(f"逐字节比对: {total - mismatches}/{total} 一致")
+    return mismatches
+
+def bench(n: int, size: int):
+    """测量单线程每秒处理的消息数"""
+    plain = _message("/refresh " + "x" * max(0, size - 9))
+    nonce, timestamp = "benchnonce", "1700000000"
+    body = _envelope(plain, nonce, timestamp)
+    sig = _signature_of(body)
+
+    results = {}
+    for label, fast in (("wechatpy", False), ("fast path", True)):
+        adapter = WeChatCryptoAdapter(TOKEN, AES_KEY, CORP_ID, fast=fast)
+        for _ in range(min(n, 200)):  # 预热
+            _roundtrip(adapter, body, sig, timestamp, nonce)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            _roundtrip(adapter, body, sig, timestamp, nonce)
+        elapsed = time.perf_counter() - t0
+        results[label] = n / elapsed
+        print(f"{label:<10} {n / elapsed:>10.0f} msg/s/core  ({elapsed / n * 1e6:.1f} µs/msg)")
+    print(f"加速比: {results['fast path'] / results['wechatpy']:.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="加解密快速路径比对与基准")
+    parser.add_argument("--n", type=int, default=5000, help="基准消息数")
+    parser.add_argument("--size", type=int, default=200, help="消息内容长度（字符）")
+    parser.add_argument("--verify-only", action="store_true", help="只做逐字节比对")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)  # 适配器逐条打印的日志不计入基准
+
+    if verify():
+        sys.exit(1)
+    if not args.verify_only:
+        bench(args.n, args.size)
+
+if __name__ == "__main__":
+    main()
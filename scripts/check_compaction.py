@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# scripts/check_compaction.py
+"""
+定时归档自检：用真实的注册表文件与刷新引擎执行一轮 CompactionScheduler
+
+    python scripts/check_compaction.py
+
+检查：启用的源中超过保留期的已推送项被归档、保留期内与未推送的项留在数据文件、
+禁用的源不被处理、归档项可通过 history 查到；目录源中有损坏文件时其余文件照常处理。
+"""
+import sys
+import json
+import time
+import logging
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.compaction import CompactionScheduler
+from core.registry.registry import SourceRegistry
+from core.refresh.engine import RefreshEngine
+from core.refresh.archive import segment_paths
+
+DAY = 86400
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    print(f"{'✓' if ok else '✗'} {name}" + (f": {detail}" if detail and not ok else ""))
+    return ok
+
+class _Failures(logging.Handler):
+    """收集调度线程吞掉的错误日志"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record.getMessage())
+
+def main():
+    failures = _Failures()
+    logging.getLogger("app.compaction").addHandler(failures)
+    logging.getLogger("core.refresh.engine").addHandler(logging.NullHandler())  # 损坏文件的预期错误不输出
+
+    now = int(time.time())
+    items = [
+        {"id": 1, "pushed": True, "pushed_at": now - 10 * DAY},  # 超过保留期
+        {"id": 2, "pushed": True, "pushed_at": now - 1 * DAY},   # 保留期内
+        {"id": 3},                                                # 未推送
+    ]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        (base / "active.json").write_text(json.dumps(items), encoding="utf-8")
+        (base / "disabled.json").write_text(json.dumps(items), encoding="utf-8")
+        (base / "logs").mkdir()
+        (base / "logs" / "a.json").write_text(json.dumps(items), encoding="utf-8")
+        (base / "logs" / "broken.json").write_text('{"id": ', encoding="utf-8")
+
+        registry = SourceRegistry(base / "registry.json")
+        with registry.batch():
+            registry.register_source("active", "active.json")
+            registry.register_source("disabled", "disabled.json", enabled=False)
+            registry.register_source("logs", "logs")  # 目录源
+        registry = SourceRegistry(base / "registry.json")  # 从文件重新加载，与服务启动时一致
+        engine = RefreshEngine(base)
+
+        scheduler = CompactionScheduler([(registry, engine)], retention_seconds=7 * DAY, interval_seconds=3600)
+        try:
+            scheduler.run_once()
+            results.append(check("一轮压缩没有抛出异常", True))
+        except Exception as e:
+            results.append(check("一轮压缩没有抛出异常", False, repr(e)))
+
+        active = json.loads((base / "active.json").read_text(encoding="utf-8"))
+        results.append(check("过期的已推送项被移出数据文件", [i["id"] for i in active] == [2, 3], str(active)))
+        results.append(check("写入了归档段", len(segment_paths(base / "active.json")) == 1))
+
+        disabled = json.loads((base / "disabled.json").read_text(encoding="utf-8"))
+        results.append(check("禁用的源不被处理",
+                             len(disabled) == 3 and not segment_paths(base / "disabled.json"), str(disabled)))
+
+        history = engine.history(registry.get_source("active"))
+        results.append(check("归档项可通过 history 查到", '"id": 1' in history, history))
+
+        logs = json.loads((base / "logs" / "a.json").read_text(encoding="utf-8"))
+        results.append(check("目录源中损坏的文件不影响其余文件的压缩", [i["id"] for i in logs] == [2, 3], str(logs)))
+        history = engine.history(registry.get_source("logs"))
+        results.append(check("目录源的 history 跳过损坏的文件并注明",
+                             '"id": 1' in history and "broken.json" in history, history))
+        results.append(check("没有错误日志", not failures.records, str(failures.records)))
+
+    passed = sum(results)
+    print(f"{passed}/{len(results)} 通过")
+    sys.exit(0 if passed == len(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# scripts/check_http_source.py
+"""
+远程(HTTP)数据源自检：对本地模拟服务器验证条件请求与投递状态
+
+    python scripts/check_http_source.py
+
+依次检查：首次拉取投递全部对象；上游未变化时带 If-None-Match 请求并收到 304；
+上游新增对象后只投递新增部分；租约提交后同样收到 304、释放后重新投递；
+源名称含路径分隔符时状态文件仍在状态目录内。
+"""
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from core.model.source import Source
+from core.refresh.engine import RefreshEngine
+from core.refresh.lease import Lease
+
+class Upstream:
+    """模拟上游：返回带 ETag 的 JSON，命中 If-None-Match 时返回 304"""
+
+    def __init__(self):
+        self.items = []
+        self.log = []  # (请求的 If-None-Match, 响应状态码)
+
+    def body(self) -> bytes:
+        return json.dumps({"data": {"items": self.items}}).encode("utf-8")
+
+    def etag(self) -> str:
+        return '"' + hashlib.sha1(self.body()).hexdigest()[:16] + '"'
+
+    def handler(self):
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive，与连接池复用连接的场景一致
+
+            def do_GET(self):
+                inm = self.headers.get("If-None-Match")
+                etag = upstream.etag()
+                if inm == etag:
+                    upstream.log.append((inm, 304))
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = upstream.body()
+                upstream.log.append((inm, 200))
+                self.send_response(200)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+def check(name: str, ok: bool, detail: str = "") -> bool:
+    print(f"{'✓' if ok else '✗'} {name}" + (f": {detail}" if detail and not ok else ""))
+    return ok
+
+def main():
+    upstream = Upstream()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), upstream.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/items.json"
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        engine = RefreshEngine(base)
+        source = Source(name_key="remote", kind="http", url=url, dot_path="data.items")
+
+        # 1. 首次拉取：无条件请求，投递全部对象
+        upstream.items = [{"id": 1, "msg": "a"}, {"id": 2, "msg": "b"}]
+        reply = engine.refresh_source(source)
+        results.append(check("首次拉取投递全部对象", '"id": 1' in reply and '"id": 2' in reply, reply))
+        results.append(check("首次请求不带 If-None-Match", upstream.log[-1] == (None, 200), str(upstream.log)))
+
+        # 2. 上游未变化：带 ETag 的条件请求，收到 304，不再投递
+        reply = engine.refresh_source(source)
+        results.append(check("未变化时收到 304", upstream.log[-1] == (upstream.etag(), 304), str(upstream.log)))
+        results.append(check("304 时无更新", reply == "No Any Update", reply))
+
+        # 3. 上游新增对象：ETag 变化，只投递新增部分
+        upstream.items.append({"id": 3, "msg": "c"})
+        reply = engine.refresh_source(source)
+        results.append(check("变化后重新拉取", upstream.log[-1][1] == 200, str(upstream.log)))
+        results.append(check("只投递新增对象", '"id": 3' in reply and '"id": 1' not in reply, reply))
+        reply = engine.refresh_source(source)
+        results.append(check("再次刷新收到 304", upstream.log[-1][1] == 304 and reply == "No Any Update", reply))
+
+        # 4. 租约投递（聊天回调的默认方式）：提交后条件请求缓存生效，释放后完整拉取并重新投递
+        leased = Source(name_key="leased", kind="http", url=url, dot_path="data.items")
+        lease = Lease.new(60)
+        reply = engine.refresh_source(leased, lease=lease)
+        engine.commit_lease(lease)
+        reply = engine.refresh_source(leased, lease=Lease.new(60))
+        results.append(check("租约提交后未变化时收到 304", upstream.log[-1][1] == 304 and reply == "No Any Update",
+                             str(upstream.log)))
+
+        upstream.items.append({"id": 4, "msg": "d"})
+        lease = Lease.new(60)
+        engine.refresh_source(leased, lease=lease)
+        engine.release_lease(lease)
+        reply = engine.refresh_source(leased)
+        results.append(check("租约释放后完整拉取并重新投递", upstream.log[-1][1] == 200 and '"id": 4' in reply, reply))
+
+        # 5. 源名称含路径分隔符：状态文件不逃逸出状态目录
+        evil = Source(name_key="../../escape", kind="http", url=url, dot_path="data.items")
+        engine.refresh_source(evil)
+        state_dir = engine.state_dir.resolve()
+        files = [p.resolve() for p in base.rglob("*.json")]
+        results.append(check("状态文件都在状态目录内",
+                             all(state_dir in p.parents for p in files), str(files)))
+        results.append(check("没有写到数据目录之外", not (base.parent / "escape.json").exists()))
+
+    server.shutdown()
+    passed = sum(results)
+    print(f"{passed}/{len(results)} 通过")
+    sys.exit(0 if passed == len(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -4,31 +4,75 @@
 企业微信机器人管理脚本
 支持注册、移除、列表、启用/禁用数据源等操作
 """
+import os
 import sys
+import json
 import argparse
 from pathlib import Path
 
 # 添加项目根目录到Python路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from core.registry.registry import SourceRegistry
-from core.refresh.engine import RefreshEngine
-from config.settings import Settings
+# 注意：重量级依赖（pydantic / Flask / wechatpy）均在命令内部按需导入，
+# 以保证 cron 场景下 list 等简单命令的冷启动足够快。
+
+def _load_settings():
+    """按需导入并加载配置"""
+    from config.settings import Settings
+    return Settings.load()
+
+def _load_registry(settings):
+    """按需导入并加载注册表"""
+    from core.registry.registry import SourceRegistry
+    return SourceRegistry(Path(settings.bot_registry_file))
+
+def _load_engine(settings):
+    """按需导入并创建刷新引擎"""
+    from core.refresh.engine import RefreshEngine
+    return RefreshEngine(
+        settings.json_base_dir,
+        dedup_window=settings.dedup_window_seconds,
+        dedup_fields=settings.dedup_fields,
+        dedup_max_entries=settings.dedup_max_entries
+    )
+
+def _raw_config() -> dict:
+    """读取原始配置（不做校验，供只读快速路径使用）"""
+    config_path = Path(os.getenv("WECOM_CONFIG_FILE", "config/config.json")).expanduser().resolve()
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def _read_registry_snapshot():
+    """只读快速路径：直接读取已校验的注册表快照，未命中返回None"""
+    from core.registry.snapshot import load_snapshot
+    registry_file = _raw_config().get("bot_registry_file")
+    if not registry_file:
+        return None
+    return load_snapshot(Path(registry_file))
 
 def set_source(args):
     """注册/更新数据源"""
-    settings = Settings.load()
-    registry = SourceRegistry(Path(settings.bot_registry_file))
+    settings = _load_settings()
+    registry = _load_registry(settings)
     
     success = registry.register_source(
         name_key=args.name,
         file_path=args.file,
-        dot_path=args.key
+        dot_path=args.key,
+        weight=args.weight,
+        url=args.url,
+        index_fields=[f for f in (args.index or "").split(",") if f.strip()],
+        transform=args.transform,
+        digest_fields=[f for f in (args.digest_fields or "").split(",") if f.strip()]
     )
     
     if success:
         print(f"✓ 数据源 '{args.name}' 注册成功")
-        print(f"  文件: {args.file}")
+        print(f"  {'地址' if args.url else '文件'}: {args.url or args.file}")
         if args.key:
             print(f"  路径: {args.key}")
     else:
@@ -37,8 +81,8 @@ def set_source(args):
 
 def remove_source(args):
     """移除数据源"""
-    settings = Settings.load()
-    registry = SourceRegistry(Path(settings.bot_registry_file))
+    settings = _load_settings()
+    registry = _load_registry(settings)
     
     if registry.remove_source(args.name):
         print(f"✓ 数据源 '{args.name}' 已移除")
@@ -48,9 +92,11 @@ def remove_source(args):
 
 def list_sources(args):
     """列出所有数据源"""
-    settings = Settings.load()
-    registry = SourceRegistry(Path(settings.bot_registry_file))
-    sources = registry.list_sources()
+    sources = _read_registry_snapshot()
+    if sources is None:
+        # 快照未命中：完整加载（同时会刷新快照）
+        registry = _load_registry(_load_settings())
+        sources = {k: v.model_dump() for k, v in registry.list_sources().items()}
     
     if not sources:
         print("未配置任何数据源")
@@ -59,31 +105,153 @@ def list_sources(args):
     print(f"已注册的数据源 ({len(sources)}):")
     print("-" * 60)
     for name_key, source in sources.items():
-        status = "启用" if source.enabled else "禁用"
+        status = "启用" if source.get("enabled", True) else "禁用"
         print(f"名称: {name_key}")
-        print(f"文件: {source.file}")
-        if source.dot_path:
-            print(f"路径: {source.dot_path}")
+        if source.get("kind") == "http":
+            print(f"地址: {source.get('url')}")
+        else:
+            print(f"文件: {source.get('file')}")
+        if source.get("dot_path"):
+            print(f"路径: {source['dot_path']}")
+        if source.get("transform") == "digest":
+            print(f"格式: 摘要 ({', '.join(source.get('digest_fields') or source.get('index_fields') or []) or '仅计数'})")
         print(f"状态: {status}")
         print("-" * 60)
 
 def enable_source(args):
-    """启用/禁用数据源"""
-    settings = Settings.load()
-    registry = SourceRegistry(Path(settings.bot_registry_file))
+    """启用/禁用数据源（名称可为通配模式，如 team-*，一次写入）"""
+    settings = _load_settings()
+    registry = _load_registry(settings)
+    action = "禁用" if args.disable else "启用"
+    
+    missing = [p for p in args.names if not registry.match_sources(p)]
+    changed = registry.enable_matching(args.names, not args.disable)
     
-    if registry.enable_source(args.name, not args.disable):
-        action = "禁用" if args.disable else "启用"
-        print(f"✓ 数据源 '{args.name}' 已{action}")
+    if len(args.names) == 1 and not missing and len(registry.match_sources(args.names[0])) == 1:
+        print(f"✓ 数据源 '{registry.match_sources(args.names[0])[0]}' 已{action}")
     else:
-        print(f"✗ 数据源 '{args.name}' 不存在")
+        print(f"✓ 已{action} {len(changed)} 个数据源")
+        for name_key in changed:
+            print(f"  {name_key}")
+    
+    if missing:
+        for pattern in missing:
+            print(f"✗ 数据源 '{pattern}' 不存在")
         sys.exit(1)
 
+_TRUE = {"1", "true", "yes", "y", "on"}
+_FALSE = {"0", "false", "no", "n", "off", ""}
+
+def _manifest_rows(path: Path) -> list:
+    """读取导入清单（CSV 或 JSON），返回字段字典列表
+
+    CSV 表头: name,file,key,weight,url,index,enabled
+    JSON: 对象列表，或 {名称: 对象} / 注册表格式 {"items": {名称: 对象}}
+    """
+    if path.suffix.lower() == ".csv":
+        import csv
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            return [dict(row) for row in csv.DictReader(f)]
+    
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("items", data)
+        # 非对象的取值原样保留，由 _manifest_entry 报告为该项的错误
+        return [{"name": k, **v} if isinstance(v, dict) else (k, v) for k, v in data.items()]
+    return data
+
+def _manifest_entry(row: dict) -> dict:
+    """把清单中的一行规范化为 register_source 参数"""
+    if isinstance(row, tuple):
+        raise ValueError(f"清单项必须是对象，实际为 {type(row[1]).__name__}")
+    if not isinstance(row, dict):
+        raise ValueError(f"清单项必须是对象，实际为 {type(row).__name__}")
+    
+    def get(*keys):
+        for k in keys:
+            v = row.get(k)
+            if v not in (None, ""):
+                return v.strip() if isinstance(v, str) else v
+        return None
+    
+    name = get("name", "name_key")
+    if not name:
+        raise ValueError("缺少 name")
+    
+    index = get("index", "index_fields") or []
+    if isinstance(index, str):
+        index = [f.strip() for f in index.replace(";", ",").split(",") if f.strip()]
+    
+    digest_fields = get("digest_fields") or []
+    if isinstance(digest_fields, str):
+        digest_fields = [f.strip() for f in digest_fields.replace(";", ",").split(",") if f.strip()]
+    
+    enabled = get("enabled")
+    if isinstance(enabled, str):
+        if enabled.lower() not in _TRUE | _FALSE:
+            raise ValueError(f"enabled 无法识别: {enabled}")
+        enabled = enabled.lower() in _TRUE
+    
+    return {
+        "name_key": name,
+        "file_path": get("file"),
+        "dot_path": get("key", "dot_path"),
+        "weight": float(get("weight") or 0.0),
+        "url": get("url"),
+        "index_fields": index,
+        "enabled": True if enabled is None else bool(enabled),
+        "transform": get("transform"),
+        "digest_fields": digest_fields,
+    }
+
+def import_sources(args):
+    """从CSV/JSON清单批量注册数据源（一次写入注册表）"""
+    path = Path(args.manifest)
+    rows = _manifest_rows(path)
+    
+    settings = _load_settings()
+    registry = _load_registry(settings)
+    
+    failed = []
+    registered = 0
+    try:
+        with registry.batch():
+            for lineno, row in enumerate(rows, start=1):
+                try:
+                    entry = _manifest_entry(row)
+                except (ValueError, TypeError) as e:
+                    name = row.get("name") if isinstance(row, dict) else row[0] if isinstance(row, tuple) else None
+                    failed.append((lineno, name, str(e)))
+                    continue
+                if registry.register_source(**entry):
+                    registered += 1
+                else:
+                    failed.append((lineno, entry["name_key"], "校验失败"))
+            
+            if failed and args.strict:
+                raise ValueError(f"{len(failed)} 行无效，已放弃全部导入")
+    finally:
+        for lineno, name, reason in failed:
+            print(f"✗ 第 {lineno} 项 ({name or '?'}): {reason}")
+    
+    print(f"✓ 从 {path} 导入 {registered} 个数据源" + (f"，{len(failed)} 项失败" if failed else ""))
+    if failed:
+        sys.exit(1)
+
+def _parse_filters(args):
+    """解析命令行中的过滤条件"""
+    if not getattr(args, "filters", None):
+        return None
+    from core.refresh.filters import parse_query
+    return parse_query(args.filters)
+
 def test_refresh(args):
     """测试刷新功能"""
-    settings = Settings.load()
-    registry = SourceRegistry(Path(settings.bot_registry_file))
-    engine = RefreshEngine(settings.json_base_dir)
+    settings = _load_settings()
+    registry = _load_registry(settings)
+    engine = _load_engine(settings)
+    query = _parse_filters(args)
     
     if args.name:
         # 刷新指定源
@@ -93,7 +261,7 @@ def test_refresh(args):
             sys.exit(1)
         
         print(f"刷新数据源: {args.name}")
-        result = engine.refresh_source(source)
+        result = engine.refresh_source(source, query=query)
     else:
         # 刷新所有源
         sources = registry.get_enabled_sources()
@@ -106,16 +274,17 @@ def test_refresh(args):
 
 def reset_source(args):
     """重置数据源pushed状态"""
-    settings = Settings.load()
-    registry = SourceRegistry(Path(settings.bot_registry_file))
-    engine = RefreshEngine(settings.json_base_dir)
+    settings = _load_settings()
+    registry = _load_registry(settings)
+    engine = _load_engine(settings)
+    query = _parse_filters(args)
     
     if args.name == "all":
         # 重置所有源
         sources = registry.get_enabled_sources()
         print(f"重置所有数据源 ({len(sources)})...")
         for name_key, source in sources.items():
-            result = engine.reset_source(source)
+            result = engine.reset_source(source, query=query, include_archive=args.archive)
             print(f"  {name_key}: {result}")
     else:
         # 重置指定源
@@ -125,9 +294,183 @@ def reset_source(args):
             sys.exit(1)
         
         print(f"重置数据源: {args.name}")
-        result = engine.reset_source(source)
+        result = engine.reset_source(source, query=query, include_archive=args.archive)
         print(result)
 
+def compact_sources(args):
+    """归档已推送且超过保留期的项"""
+    settings = _load_settings()
+    registry = _load_registry(settings)
+    engine = _load_engine(settings)
+    
+    days = args.retention_days if args.retention_days is not None else settings.compaction_retention_days
+    if days is None:
+        print("✗ 未指定保留天数：请使用 --retention-days 或配置 compaction_retention_days")
+        sys.exit(1)
+    
+    if args.name:
+        source = registry.get_source(args.name)
+        if not source:
+            print(f"✗ 数据源 '{args.name}' 不存在")
+            sys.exit(1)
+        sources = {args.name: source}
+    else:
+        sources = registry.get_enabled_sources()
+    
+    print(f"归档推送超过 {days:g} 天的项 ({len(sources)} 个数据源)...")
+    for name_key, source in sources.items():
+        print(f"  {name_key}: {engine.compact_source(source, days * 86400)}")
+
+def show_history(args):
+    """查询已推送的历史项（含归档）"""
+    settings = _load_settings()
+    registry = _load_registry(settings)
+    engine = _load_engine(settings)
+    query = _parse_filters(args)
+    
+    source = registry.get_source(args.name)
+    if not source:
+        print(f"✗ 数据源 '{args.name}' 不存在")
+        sys.exit(1)
+    
+    print(engine.history(source, query=query))
+
+def _percentile(values, q: float) -> float:
+    """有序列表的分位数（最近秩）"""
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summarize_profiles(args):
+    """汇总剖析目录中的慢请求与采样数据"""
+    profile_dir = args.dir or _raw_config().get("profile_dir")
+    if not profile_dir:
+        print("✗ 未指定剖析目录：请使用 --dir 或配置 profile_dir")
+        sys.exit(1)
+    import time
+    profile_dir = Path(profile_dir).expanduser().resolve()
+    
+    records = []
+    for p in sorted(profile_dir.glob("*.json")):
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    if not records:
+        print(f"{profile_dir} 中没有剖析记录")
+        return
+    
+    reasons = {}
+    for r in records:
+        reasons[r.get("reason")] = reasons.get(r.get("reason"), 0) + 1
+    totals = sorted(r["total_ms"] for r in records)
+    print(f"剖析记录 {len(records)} 份 ({', '.join(f'{k} {v}' for k, v in sorted(reasons.items()))})")
+    print(f"总耗时: 平均 {sum(totals) / len(totals):.1f} ms, p50 {_percentile(totals, 0.5):.1f} ms, "
+          f"p95 {_percentile(totals, 0.95):.1f} ms, 最大 {totals[-1]:.1f} ms")
+    
+    # 分阶段耗时
+    stages = {}
+    for r in records:
+        for s in r.get("stages", []):
+            stages.setdefault(s["name"], []).append(s["ms"])
+    print("-" * 60)
+    print(f"{'阶段':<16}{'次数':>6}{'平均ms':>10}{'p95ms':>10}{'最大ms':>10}")
+    for name, values in sorted(stages.items(), key=lambda kv: -sum(kv[1])):
+        values.sort()
+        print(f"{name:<16}{len(values):>6}{sum(values) / len(values):>10.1f}"
+              f"{_percentile(values, 0.95):>10.1f}{values[-1]:>10.1f}")
+    
+    # 按命令
+    commands = {}
+    for r in records:
+        commands.setdefault(r.get("tags", {}).get("command") or "-", []).append(r["total_ms"])
+    print("-" * 60)
+    print(f"{'命令':<16}{'次数':>6}{'平均ms':>10}{'最大ms':>10}")
+    for name, values in sorted(commands.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{name:<16}{len(values):>6}{sum(values) / len(values):>10.1f}{max(values):>10.1f}")
+    
+    # 最慢的请求
+    print("-" * 60)
+    print("最慢的请求:")
+    for r in sorted(records, key=lambda r: -r["total_ms"])[:args.slowest]:
+        breakdown = ", ".join(f"{s['name']} {s['ms']:.1f}" for s in r.get("stages", []))
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r.get("time", 0)))
+        print(f"  {when} RID {r['rid']} {r['total_ms']:.1f} ms "
+              f"[{r.get('tags', {}).get('command') or '-'}] {breakdown}")
+    
+    # 合并所有 cProfile 数据
+    profiles = [str(profile_dir / r["profile"]) for r in records
+                if r.get("profile") and (profile_dir / r["profile"]).exists()]
+    if profiles:
+        import pstats
+        print("=" * 60)
+        print(f"合并 {len(profiles)} 份 cProfile 数据 (按 {args.sort} 排序):")
+        stats = pstats.Stats(*profiles, stream=sys.stdout)
+        stats.strip_dirs().sort_stats(args.sort).print_stats(args.top)
+
+def startup_report(args):
+    """启动耗时报告：分解各阶段导入与初始化耗时"""
+    import time
+    import importlib
+    
+    stages = []
+    
+    def timed(label, fn):
+        t0 = time.perf_counter()
+        result = fn()
+        stages.append((label, (time.perf_counter() - t0) * 1000))
+        return result
+    
+    settings_mod = timed("import config.settings (pydantic)", lambda: importlib.import_module("config.settings"))
+    settings = timed("Settings.load", settings_mod.Settings.load)
+    registry_mod = timed("import core.registry", lambda: importlib.import_module("core.registry.registry"))
+    
+    from core.registry.snapshot import load_snapshot
+    registry_file = Path(settings.bot_registry_file)
+    hit = load_snapshot(registry_file, list(importlib.import_module("core.model.source").Source.model_fields)) is not None
+    timed(f"SourceRegistry (snapshot {'hit' if hit else 'miss'})", lambda: registry_mod.SourceRegistry(registry_file))
+    timed("import core.refresh", lambda: importlib.import_module("core.refresh.engine"))
+    
+    if not args.no_web:
+        timed("import flask", lambda: importlib.import_module("flask"))
+        timed("import wechatpy (crypto)", lambda: importlib.import_module("wechatpy.enterprise"))
+        timed("import app.web", lambda: importlib.import_module("app.web.routes"))
+        main_mod = timed("import main", lambda: importlib.import_module("main"))
+        timed("create_app", main_mod.create_app)
+    
+    total = sum(ms for _, ms in stages)
+    print(f"启动耗时报告 (不含解释器自身启动, 合计 {total:.1f} ms):")
+    print("-" * 60)
+    for label, ms in stages:
+        share = ms / total * 100 if total else 0.0
+        print(f"{label:<40} {ms:>9.1f} ms {share:>5.1f}%")
+    print("-" * 60)
+    
+    if args.imports:
+        _print_import_hotspots(args.imports)
+
+def _print_import_hotspots(top: int):
+    """在子进程中以 -X importtime 导入 main，列出自身耗时最高的模块"""
+    import subprocess
+    
+    root = Path(__file__).parent.parent
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=root, capture_output=True, text=True
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        rows.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    
+    rows.sort(reverse=True)
+    print(f"导入耗时最高的 {top} 个模块 (self / cumulative):")
+    for self_us, cum_us, name in rows[:top]:
+        print(f"{name:<40} {self_us / 1000:>8.1f} ms {cum_us / 1000:>8.1f} ms")
+
 def main():
     parser = argparse.ArgumentParser(description="企业微信机器人管理工具")
     subparsers = parser.add_subparsers(dest="command", help="可用命令")
@@ -135,8 +478,13 @@ def main():
     # set 命令
     set_parser = subparsers.add_parser("set", help="注册/更新数据源")
     set_parser.add_argument("name", help="数据源名称")
-    set_parser.add_argument("file", help="JSON文件相对路径")
+    set_parser.add_argument("file", nargs="?", help="JSON文件相对路径（远程源可省略）")
+    set_parser.add_argument("--url", help="远程JSON地址，注册为http源")
+    set_parser.add_argument("--index", help="二级索引字段，逗号分隔 (如 severity,id)")
     set_parser.add_argument("--key", help="JSON内部路径 (如 a.b[0].c)")
+    set_parser.add_argument("--weight", type=float, default=0.0, help="刷新优先级，越大越先刷新")
+    set_parser.add_argument("--transform", choices=["digest"], help="输出格式：digest 回复按字段汇总的摘要")
+    set_parser.add_argument("--digest-fields", help="摘要统计字段，逗号分隔（默认使用索引字段）")
     set_parser.set_defaults(func=set_source)
     
     # remove 命令
@@ -150,24 +498,58 @@ def main():
     
     # enable/disable 命令
     enable_parser = subparsers.add_parser("enable", help="启用数据源")
-    enable_parser.add_argument("name", help="数据源名称")
-    enable_parser.set_defaults(func=enable_source)
+    enable_parser.add_argument("names", nargs="+", metavar="name", help="数据源名称或通配模式 (如 team-*)")
+    enable_parser.set_defaults(func=enable_source, disable=False)
     
     disable_parser = subparsers.add_parser("disable", help="禁用数据源")
-    disable_parser.add_argument("name", help="数据源名称")
-    disable_parser.add_argument("--disable", action="store_true", default=True)
-    disable_parser.set_defaults(func=enable_source)
+    disable_parser.add_argument("names", nargs="+", metavar="name", help="数据源名称或通配模式 (如 team-*)")
+    disable_parser.set_defaults(func=enable_source, disable=True)
+    
+    # import 命令
+    import_parser = subparsers.add_parser("import", help="从CSV/JSON清单批量注册数据源")
+    import_parser.add_argument("manifest", help="清单文件 (.csv 或 .json)")
+    import_parser.add_argument("--strict", action="store_true", help="任一项无效则放弃全部导入")
+    import_parser.set_defaults(func=import_sources)
     
     # test 命令
     test_parser = subparsers.add_parser("test", help="测试刷新功能")
     test_parser.add_argument("--name", help="指定数据源名称，不指定则刷新全部")
+    test_parser.add_argument("filters", nargs="*", help="过滤条件 (如 severity=high limit=20)，需配合 --name")
     test_parser.set_defaults(func=test_refresh)
     
     # reset 命令
     reset_parser = subparsers.add_parser("reset", help="重置pushed状态")
     reset_parser.add_argument("name", help="数据源名称或'all'")
+    reset_parser.add_argument("filters", nargs="*", help="过滤条件 (如 id>=100)")
+    reset_parser.add_argument("--archive", action="store_true", help="同时把归档中匹配的项恢复到数据文件")
     reset_parser.set_defaults(func=reset_source)
     
+    # compact 命令
+    compact_parser = subparsers.add_parser("compact", help="归档超过保留期的已推送项")
+    compact_parser.add_argument("--name", help="指定数据源名称，不指定则处理全部启用的源")
+    compact_parser.add_argument("--retention-days", type=float, help="保留天数（缺省使用配置 compaction_retention_days）")
+    compact_parser.set_defaults(func=compact_sources)
+    
+    # history 命令
+    history_parser = subparsers.add_parser("history", help="查询已推送的历史项（含归档）")
+    history_parser.add_argument("name", help="数据源名称")
+    history_parser.add_argument("filters", nargs="*", help="过滤条件 (如 id=42 limit=50)")
+    history_parser.set_defaults(func=show_history)
+    
+    # profiles 命令
+    profiles_parser = subparsers.add_parser("profiles", help="汇总剖析记录（慢请求与采样）")
+    profiles_parser.add_argument("--dir", help="剖析目录（缺省使用配置 profile_dir）")
+    profiles_parser.add_argument("--top", type=int, default=20, help="列出的函数数量")
+    profiles_parser.add_argument("--sort", default="cumulative", help="cProfile 排序键 (cumulative/tottime/calls)")
+    profiles_parser.add_argument("--slowest", type=int, default=5, help="列出的最慢请求数量")
+    profiles_parser.set_defaults(func=summarize_profiles)
+    
+    # startup 命令
+    startup_parser = subparsers.add_parser("startup", help="启动耗时报告")
+    startup_parser.add_argument("--no-web", action="store_true", help="不统计Web与加解密栈")
+    startup_parser.add_argument("--imports", type=int, default=0, metavar="N", help="额外列出导入耗时最高的N个模块")
+    startup_parser.set_defaults(func=startup_report)
+    
     args = parser.parse_args()
     
     if not args.command: